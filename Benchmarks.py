@@ -0,0 +1,215 @@
+# positioningempiricalmaxstacksdesigns
+# Copyright (C) 2026 THEO BOURY
+
+#This file contains the micro-benchmarks of the kernels of the experiments, to compare their running times across commits.
+#Each kernel is timed over a grid of sizes n, and the sequence kernels over several types of sequences:
+# - "random_compatible", a random compatible sequence with A at the unpaired positions, as in the Stacking experiments,
+# - "separable", a separable design, as in the Separable experiment,
+# - "degenerate", a random sequence over G and C only, with many co-optimal structures.
+#The structure kernels (generation and counting of designs) only depend on the structure, their type is "structure".
+#All random choices are seeded from the base seed, the size and the type: the inputs are the same on every run.
+#For each kernel and type, the scaling exponent is the slope of the running time against n in log-log scale.
+#Results are written as JSON. Only the Python code of the repository and numpy are needed, not ViennaRNA.
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from checkSeparability import dbn_to_flat_tree, ssparse, num_design, separable_leaf_levels, modulo_separable_designs
+from foldingBP import FillMatUnitary, FillMatUnitaryNumpy
+from foldingStacking import FillMatStacking2, FillMatStackingNumpy, DeltaBackTrackE2
+from RandomCompatible import choose_random_seq
+from SecondaryStructureGeneration import sscount, ssrandom, build_count_tables, count_tables_views, ssrandom_filtered
+
+#Parameters of the structures, as in the experiments.
+THETA = 3
+MIN_HELIX = 3
+
+#DeltaBackTrackE2 lists all the co-optimal structures, it is skipped beyond this number of them.
+BACKTRACK_LIMIT = 10000
+
+SEQUENCE_TYPES = ["random_compatible", "separable", "degenerate"]
+
+
+def seed_random(seed, n, kind):
+    """
+    Input:
+        * seed, the base seed
+        * n, the size
+        * kind, the type of input
+    Output:
+        * Seeds the random generator from (seed, n, kind), so that the inputs do not depend on the kernels run before
+    """
+    random.seed("%d-%d-%s" % (seed, n, kind))
+
+
+def benchmark_inputs(n, seed):
+    """
+    Input:
+        * n, the size
+        * seed, the base seed
+    Output:
+        * A structure of size n with no large loop and at least one separable design, its flat tree, its count tables,
+          the first (m, leaves_levels_mod) with a design and a dictionary with a sequence of size n of each type
+    """
+    arr = build_count_tables(n, THETA, MIN_HELIX)
+    tables = count_tables_views(arr)
+    seed_random(seed, n, "structure")
+    found = None
+    while found is None:
+        ss = ssrandom_filtered(n, tables, THETA, MIN_HELIX)
+        t = dbn_to_flat_tree(ssparse(ss))
+        (found, _) = separable_leaf_levels(t, modulolimit=4)
+    seqs = {}
+    seed_random(seed, n, "random_compatible")
+    seqs["random_compatible"] = choose_random_seq(t, withA=True)
+    seed_random(seed, n, "separable")
+    seqs["separable"] = modulo_separable_designs(t, 1, modulolimit=4)[0]
+    seed_random(seed, n, "degenerate")
+    seqs["degenerate"] = "".join(random.choice("GC") for _ in range(n))
+    return ss, t, tables, found, seqs
+
+
+def time_kernel(function, repeat):
+    """
+    Input:
+        * function, a function without argument
+        * repeat, the number of runs
+    Output:
+        * The shortest running time of function over the runs, in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def structure_kernels(n, ss, t, tables, found):
+    """
+    Input:
+        * n, the size
+        * ss, t, tables, found, as returned by benchmark_inputs
+    Output:
+        * The list of the (name, function) of the kernels on the structure
+    """
+    count = {}
+    count_stacked = {}
+    sscount(n, count, count_stacked, THETA, MIN_HELIX)
+    (m, leaf_level) = found
+    return [("sscount", lambda: sscount(n, {}, {}, THETA, MIN_HELIX)),
+            ("ssrandom", lambda: ssrandom(n, count, count_stacked, THETA, MIN_HELIX)),
+            ("build_count_tables", lambda: build_count_tables(n, THETA, MIN_HELIX)),
+            ("ssrandom_filtered", lambda: ssrandom_filtered(n, tables, THETA, MIN_HELIX)),
+            ("num_design", lambda: num_design(t, "R", 0, m, leaf_level, {})),
+            ("separable_leaf_levels", lambda: separable_leaf_levels(t, modulolimit=4))]
+
+
+def sequence_kernels(seq):
+    """
+    Input:
+        * seq, a sequence
+    Output:
+        * The list of the (name, function, reason) of the kernels on the sequence, reason being None or why the kernel is skipped
+    """
+    n = len(seq)
+    E, S, NE, _ = FillMatStacking2(seq, count=True)
+    reason = None
+    if NE[0][n - 1] > BACKTRACK_LIMIT:
+        reason = "more than " + str(BACKTRACK_LIMIT) + " co-optimal structures"
+    return [("FillMatStacking2", lambda: FillMatStacking2(seq), None),
+            ("FillMatStackingNumpy", lambda: FillMatStackingNumpy(seq), None),
+            ("FillMatUnitary", lambda: FillMatUnitary(seq), None),
+            ("FillMatUnitaryNumpy", lambda: FillMatUnitaryNumpy(seq), None),
+            ("DeltaBackTrackE2", lambda: DeltaBackTrackE2([(0, n - 1)], [], 0, E, S, seq), reason)]
+
+
+def scaling_exponent(ns, times):
+    """
+    Input:
+        * ns, a list of sizes
+        * times, the running times for these sizes, None when not measured
+    Output:
+        * The slope of log(time) against log(n), None with less than two measures
+    """
+    points = [(n, s) for n, s in zip(ns, times) if s is not None and s > 0]
+    if len(points) < 2:
+        return None
+    (slope, _) = np.polyfit(np.log([n for n, _ in points]), np.log([s for _, s in points]), 1)
+    return float(slope)
+
+
+def git_commit():
+    """
+    Output:
+        * The commit of the repository, None if it is unknown
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(grid, repeat=3, seed=0, kernels=None):
+    """
+    Input:
+        * grid, the list of sizes n
+        * repeat, the number of runs of each kernel, the shortest one is kept
+        * seed, the base seed of the inputs
+        * kernels, None or the list of the names of the kernels to run
+    Output:
+        * A dictionary, ready for JSON, with the environment, the running time of each kernel, type and n,
+          and the scaling exponent of each kernel and type
+    """
+    results = []
+    for n in grid:
+        (ss, t, tables, found, seqs) = benchmark_inputs(n, seed)
+        runs = [(name, "structure", function, None) for (name, function) in structure_kernels(n, ss, t, tables, found)]
+        for kind in SEQUENCE_TYPES:
+            runs += [(name, kind, function, reason) for (name, function, reason) in sequence_kernels(seqs[kind])]
+        for (name, kind, function, reason) in runs:
+            if kernels is not None and name not in kernels:
+                continue
+            seconds = None
+            if reason is None:
+                seed_random(seed, n, name)
+                try:
+                    seconds = time_kernel(function, repeat)
+                except RecursionError:
+                    reason = "recursion limit reached"
+            results.append({"kernel": name, "type": kind, "n": n, "seconds": seconds, "skipped": reason})
+            print(name, kind, "n", n, "seconds", seconds if reason is None else "skipped, " + reason)
+    exponents = []
+    for (name, kind) in dict.fromkeys((res["kernel"], res["type"]) for res in results):
+        measures = [res for res in results if res["kernel"] == name and res["type"] == kind]
+        exponent = scaling_exponent([res["n"] for res in measures], [res["seconds"] for res in measures])
+        exponents.append({"kernel": name, "type": kind, "exponent": exponent})
+        print(name, kind, "scaling exponent", exponent)
+    return {"commit": git_commit(), "python": platform.python_version(), "numpy": np.__version__,
+            "grid": grid, "repeat": repeat, "seed": seed, "results": results, "exponents": exponents}
+
+
+parser = argparse.ArgumentParser(prog='Benchmarks')
+
+parser.add_argument('-n', '--n', type=int, nargs='+', default=[50, 100, 200, 400], help="The sizes of the inputs, default is 50 100 200 400")
+parser.add_argument('-r', '--repeat', type=int, default=3, help="The number of runs of each kernel, the shortest one is kept, default is 3")
+parser.add_argument('-s', '--seed', type=int, default=0, help="The base seed of the inputs, default is 0")
+parser.add_argument('-k', '--kernels', type=str, nargs='+', default=None, help="The kernels to run, default is all of them")
+parser.add_argument('-o', '--output', type=str, default="benchmarks.json", help="The JSON file of the results, default is benchmarks.json")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    #The recursive backtracks and samplers go deeper than the default limit for the largest sizes.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * max(args.n) + 1000))
+    report = run_benchmarks(args.n, repeat=args.repeat, seed=args.seed, kernels=args.kernels)
+    with open(args.output, 'w') as jsonfile:
+        json.dump(report, jsonfile, indent=1)
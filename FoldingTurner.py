@@ -1,28 +1,322 @@
 # positioningempiricalmaxstacksdesigns
-# Copyright (C) 2026 THEO BOURY 
+# Copyright (C) 2026 THEO BOURY
 
-import os 
-def fold_turner(seq):
+#This file contains the folding in the Turner energy model, computed with ViennaRNA.
+#The structures returned are those of "RNAsubopt -s -d2 -e 0": the first co-optimal structure and the number of co-optimal structures.
+#Two backends are available:
+# - "bindings", the ViennaRNA Python bindings, with model details (and energy parameters) loaded once for all sequences.
+# - "stream", one RNAsubopt process reading a whole batch of sequences as a multi-record FASTA on its standard input.
+#With a target structure (lazy mode, opt-in), the co-optimal structures are only enumerated when the MFE structure is the target.
+#Other sequences then get the MFE structure of "RNAfold -d2", which may differ from the first co-optimal structure of RNAsubopt:
+#the lazy mode only tells designs apart. The experiments use it with the option --lazy_turner of MaxStacksPositioning.py,
+#their rows then being written to CSV files of their own.
+#Results can be kept in an on-disk SQLite cache, keyed by a hash of the sequence and of the folding parameters,
+#so that a sequence is never folded twice across runs and experiments. The cache is off by default: it is turned on
+#with set_turner_cache, as MaxStacksPositioning.py does with its option -c.
+#The backends write no file in the working directory (RNAsubopt runs in a private temporary directory), and without cache
+#nothing is written at all: the functions can be called from many threads and processes at once.
+#With a cache, all the threads and processes given the same path share its SQLite file, opened in WAL mode with a busy timeout
+#so that they read and write it concurrently. Sharing is chosen by the caller: a different path keeps a run apart.
+
+import hashlib
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    import RNA
+except ImportError:
+    RNA = None
+
+#Folding parameters, part of the cache keys: results computed with other parameters are never mixed up.
+TURNER_PARAMS = "RNAsubopt -s -d2 -e 0"
+TURNER_MFE_PARAMS = "RNAfold -d2"
+
+#Settings and counters of the cache, without file until set_turner_cache is called.
+TURNER_CACHE = {"path": None, "max_entries": 1000000, "hits": 0, "misses": 0}
+
+#A SQLite connection can not be shared between threads or with a forked process, each thread of each process opens its own.
+TURNER_CONNECTIONS = threading.local()
+
+#Protects the counters and the lazy initialisation of the model details against concurrent threads.
+TURNER_LOCK = threading.Lock()
+
+#Model details of the bindings backend, built on the first use and then reused for all sequences.
+TURNER_MODEL = []
+
+
+def turner_model():
+    """
+    Output:
+        * The ViennaRNA model details equivalent to the options -d2 of RNAsubopt
+    """
+    with TURNER_LOCK:
+        if TURNER_MODEL == []:
+            md = RNA.md()
+            md.dangles = 2
+            #Required by RNAsubopt to list each multiloop decomposition once.
+            md.uniq_ML = 1
+            TURNER_MODEL.append(md)
+    return TURNER_MODEL[0]
+
+
+def default_backend():
+    """
+    Output:
+        * "bindings" if the ViennaRNA Python bindings can be imported, "stream" otherwise
+    """
+    if RNA is not None:
+        return "bindings"
+    return "stream"
+
+
+def fold_turner_bindings(seqs):
+    """
+    Input:
+        * seqs, a list of sequences
+    Output:
+        * For each sequence, the first co-optimal structure in Turner and the number of co-optimal structures
+    """
+    md = turner_model()
+    resu = []
+    for seq in seqs:
+        fc = RNA.fold_compound(seq, md)
+        subopts = fc.subopt(0, sorted=1)
+        resu.append((subopts[0].structure, len(subopts)))
+    return resu
+
+
+def run_stream(command, seqs):
+    """
+    Input:
+        * command, a ViennaRNA program and its options, reading a multi-record FASTA
+        * seqs, a list of sequences
+    Output:
+        * For each sequence, the non-empty lines of its output record, all sequences being folded by a single process
+    """
+    fasta = "".join(">sequence" + str(k + 1) + "\n" + seq + "\n" for k, seq in enumerate(seqs))
+    #Sequences and structures go through pipes, the process runs in a private directory in case it writes any file.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out = subprocess.run(command, input=fasta, capture_output=True, text=True, check=True, cwd=tmpdir).stdout
+    records = []
+    for line in out.splitlines():
+        if line.startswith(">"):
+            records.append([])
+        elif line.strip() != "" and records != []:
+            records[-1].append(line)
+    if len(records) != len(seqs):
+        raise RuntimeError(command[0] + " returned " + str(len(records)) + " records for " + str(len(seqs)) + " sequences")
+    return records
+
+
+def fold_turner_stream(seqs):
+    """
+    Input:
+        * seqs, a list of sequences
+    Output:
+        * For each sequence, the first co-optimal structure in Turner and the number of co-optimal structures,
+          all sequences being folded by a single RNAsubopt process
+    """
+    resu = []
+    for li in run_stream(["RNAsubopt", "-v", "-s", "-d2", "-e", "0"], seqs):
+        #The first line of a record repeats the sequence, followed by the co-optimal structures.
+        li = li[1:]
+        Turner_struct = (li[0].strip().split(" "))[0]
+        resu.append((Turner_struct, len(li)))
+    return resu
+
+
+def mfe_turner_bindings(seqs):
+    """
+    Input:
+        * seqs, a list of sequences
+    Output:
+        * For each sequence, one MFE structure in Turner and None, the number of co-optimal structures being unknown
+    """
+    md = turner_model()
+    resu = []
+    for seq in seqs:
+        (structure, _) = RNA.fold_compound(seq, md).mfe()
+        resu.append((structure, None))
+    return resu
+
+
+def mfe_turner_stream(seqs):
+    """
+    Input:
+        * seqs, a list of sequences
+    Output:
+        * For each sequence, one MFE structure in Turner and None, all sequences being folded by a single RNAfold process
+    """
+    resu = []
+    for li in run_stream(["RNAfold", "--noPS", "-d2"], seqs):
+        #The first line of a record repeats the sequence, the second one is the MFE structure followed by its energy.
+        resu.append(((li[1].strip().split(" "))[0], None))
+    return resu
+
+
+#For each backend, the enumeration of the co-optimal structures and the MFE alone, with the parameters keying their results in the cache.
+TURNER_BACKENDS = {"bindings": {TURNER_PARAMS: fold_turner_bindings, TURNER_MFE_PARAMS: mfe_turner_bindings},
+                   "stream": {TURNER_PARAMS: fold_turner_stream, TURNER_MFE_PARAMS: mfe_turner_stream}}
+
+
+def set_turner_cache(path="turner_cache.sqlite", max_entries=1000000):
+    """
+    Input:
+        * path, the SQLite file of the cache, None to disable the cache
+        * max_entries, the number of folds kept, the least recently used ones are evicted beyond it
+    Output:
+        * Sets the cache used by fold_turner and fold_turner_batch. The path is made absolute,
+          so that it does not depend on later changes of directory
+    """
+    if path is not None:
+        path = os.path.abspath(path)
+    TURNER_CACHE["path"] = path
+    TURNER_CACHE["max_entries"] = max_entries
+    TURNER_CONNECTIONS.__dict__.clear()
+
+
+def turner_cache_connection():
+    """
+    Output:
+        * The connection of the current thread to the cache, None if the cache is disabled
+    """
+    if TURNER_CACHE["path"] is None:
+        return None
+    if getattr(TURNER_CONNECTIONS, "pid", None) != os.getpid() or TURNER_CONNECTIONS.path != TURNER_CACHE["path"]:
+        connection = sqlite3.connect(TURNER_CACHE["path"], timeout=600)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS turner (key TEXT PRIMARY KEY, seq TEXT, params TEXT, struct TEXT, nb INTEGER, last_used INTEGER)")
+        connection.execute("CREATE INDEX IF NOT EXISTS turner_last_used ON turner (last_used)")
+        connection.execute("CREATE TABLE IF NOT EXISTS turner_stats (name TEXT PRIMARY KEY, value INTEGER)")
+        #The number of entries is kept up to date by cached_folds, it is only counted once for a cache created before it.
+        connection.execute("INSERT OR IGNORE INTO turner_stats SELECT 'entries', COUNT(*) FROM turner")
+        connection.commit()
+        TURNER_CONNECTIONS.connection = connection
+        TURNER_CONNECTIONS.path = TURNER_CACHE["path"]
+        TURNER_CONNECTIONS.pid = os.getpid()
+    return TURNER_CONNECTIONS.connection
+
+
+def turner_cache_key(seq, params=TURNER_PARAMS):
+    """
+    Input:
+        * seq, a sequence
+        * params, the folding parameters
+    Output:
+        * The key of seq in the cache, a hash of the sequence and of the folding parameters
+    """
+    return hashlib.sha256((params + "\n" + seq).encode()).hexdigest()
+
+
+def turner_cache_stats():
+    """
+    Output:
+        * A dictionary with the hits and misses of the current process, the ones of all runs using the cache and the number of folds stored
+    """
+    stats = {"hits": TURNER_CACHE["hits"], "misses": TURNER_CACHE["misses"]}
+    connection = turner_cache_connection()
+    if connection is not None:
+        for (name, value) in connection.execute("SELECT name, value FROM turner_stats"):
+            if name == "entries":
+                stats["entries"] = value
+            else:
+                stats["total_" + name] = value
+    return stats
+
+
+def cached_folds(seqs, params, backend):
+    """
+    Input:
+        * seqs, a list of sequences
+        * params, TURNER_PARAMS or TURNER_MFE_PARAMS, the folding to compute
+        * backend, "bindings" or "stream", by default the bindings when they are installed
+    Output:
+        * The list of the (Turner_struct, nb) of each sequence, only the sequences missing from the cache being folded
+    """
+    if len(seqs) == 0:
+        return []
+    connection = turner_cache_connection()
+    keys = [turner_cache_key(seq, params) for seq in seqs]
+    found = {}
+    if connection is not None:
+        distinct = list(set(keys))
+        #SQLite limits the number of parameters of a query.
+        for k in range(0, len(distinct), 500):
+            chunk = distinct[k:k + 500]
+            query = "SELECT key, struct, nb FROM turner WHERE key IN (" + ",".join("?" * len(chunk)) + ")"
+            for (key, struct, nb) in connection.execute(query, chunk):
+                found[key] = (struct, nb)
+
+    missing = []
+    missing_keys = []
+    for key, seq in zip(keys, seqs):
+        if key not in found and seq not in missing:
+            missing.append(seq)
+            missing_keys.append(key)
+    with TURNER_LOCK:
+        TURNER_CACHE["hits"] += len(seqs) - len(missing)
+        TURNER_CACHE["misses"] += len(missing)
+
+    if missing != []:
+        if backend is None:
+            backend = default_backend()
+        if backend not in TURNER_BACKENDS:
+            raise ValueError("Not a valid backend for Turner")
+        folded = TURNER_BACKENDS[backend][params](missing)
+        for key, res in zip(missing_keys, folded):
+            found[key] = res
+
+    if connection is not None:
+        now = time.time_ns()
+        with connection:
+            #Only the folds missing from the cache are inserted (another process may have inserted some of them meanwhile),
+            #so that the running number of entries stays exact without counting the rows.
+            inserted = connection.executemany("INSERT OR IGNORE INTO turner VALUES (?, ?, ?, ?, ?, ?)",
+                                              [(key, seq, params, found[key][0], found[key][1], now) for key, seq in zip(missing_keys, missing)]).rowcount
+            connection.executemany("UPDATE turner SET last_used = ? WHERE key = ?", [(now, key) for key in set(keys)])
+            connection.executemany("INSERT INTO turner_stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                                   [("hits", len(seqs) - len(missing)), ("misses", len(missing)), ("entries", inserted)])
+            excess = connection.execute("SELECT value FROM turner_stats WHERE name = 'entries'").fetchone()[0] - TURNER_CACHE["max_entries"]
+            if excess > 0:
+                evicted = connection.execute("DELETE FROM turner WHERE key IN (SELECT key FROM turner ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+                connection.execute("UPDATE turner_stats SET value = value - ? WHERE name = 'entries'", (evicted,))
+    return [found[key] for key in keys]
+
+
+def fold_turner_batch(seqs, backend=None, targets=None):
+    """
+    Input:
+        * seqs, a list of sequences that we designed
+        * backend, "bindings" or "stream", by default the bindings when they are installed
+        * targets, None or the list of the target structures of the sequences, for the lazy evaluation
+    Output:
+        * The list of the (Turner_struct, nb) of fold_turner for each sequence.
+          With targets, the co-optimal structures are only enumerated for the sequences whose MFE structure is their target.
+          The other ones get (MFE structure, None): they are not designs, either folding elsewhere or having several co-optimal structures.
+    """
+    if targets is None:
+        return cached_folds(seqs, TURNER_PARAMS, backend)
+    resu = cached_folds(seqs, TURNER_MFE_PARAMS, backend)
+    candidates = [k for k in range(len(seqs)) if resu[k][0] == targets[k]]
+    for k, res in zip(candidates, cached_folds([seqs[k] for k in candidates], TURNER_PARAMS, backend)):
+        resu[k] = res
+    return resu
+
+
+def fold_turner(seq, backend=None, target=None):
     """
     Input:
         * seq, a sequence that we designed
-        * target_struct, the secondary structure that we target 
-        * h, a maximal BP distance 
-        * pr, a boolean if we want some info printed or not
-    Output: 
-        * The corresponding structure in Turner
-    """
-    with open("designedseq.fa", "w") as f:
-        f.write(">sequence1\n")
-        f.write(seq + "\n")
-    os.system("RNAsubopt -v -s -d2 -e 0 < designedseq.fa > subopts.txt")
-    with open("subopts.txt", "r") as f:
-        li = f.readlines()[2:]  
-    os.system("RNAfold -p -d2 --noLP < designedseq.fa > designedseqandturner.out")
-
-    Turner_struct = (li[0].strip().split(" "))[0]
-    #print(li)
-    nb = len(li)
-    os.system("rm designedseq.fa")
-    os.system("rm subopts.txt")          
-    return Turner_struct, nb
+        * backend, "bindings" or "stream", by default the bindings when they are installed
+        * target, None or the target structure of seq, to skip the enumeration of the co-optimal structures when the MFE is not the target.
+          The structure returned is then the MFE structure of RNAfold, not the first co-optimal structure of RNAsubopt
+    Output:
+        * The corresponding structure in Turner and the number of co-optimal structures, None if it was not enumerated
+    """
+    if target is None:
+        return fold_turner_batch([seq], backend=backend)[0]
+    return fold_turner_batch([seq], backend=backend, targets=[target])[0]
@@ -3,40 +3,73 @@
 
 import argparse
 from createrandomsequencesandfold import *
+from FoldingTurner import set_turner_cache, turner_cache_stats
+from ResultsStore import csv_to_store
 
 parser = argparse.ArgumentParser(prog='MaxStacksPositioning')
 
 
 parser.add_argument('-n', '--n', type=int, required=True, help="The size of sequences to sample")
 parser.add_argument('-e', '--experiment', type=str, required=False, help="The type of experiment to launch, default is FromStackingNoLargeLoop")
-args = parser.parse_args()
-e = 0
-if args.experiment == "FromStackingNoLargeLoop":
-    e = 0
-elif args.experiment == "FromSeparableNoLargeLoop":
-    e = 1
-elif args.experiment == "FromStackingOnlyLargeLoop":
-    e = 2
-elif args.experiment == "StackingVsBP":
-    e = 3
-
-#structure = "((((((((((((((((((((....))))))))((((((((((((....))))))))((((((((((....))))))))))((((((.........))))))))))(((((.........)))))))))))))))))(((((((((((((((((((.........)))))((((((((.........))))))))((((((((....))))))))))))((((((((....))))))))((((((((((....))))))))))))))))))))"
-
-if e == 0:
-    create_stats_from_Stacking_A_only_nom3o_nom5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=1,last_index=-1)
-    from_stacking_read_stats_from_csv('ResultsfromStacking.csv')
-elif e == 1:
-    create_stats_from_Separable_A_only_nom3o_nom5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=1,last_index=-1)
-    from_separable_read_stats_from_csv('ResultsfromSeparable.csv')
-elif e == 2:
-    create_stats_from_Stacking_A_only_withm3o_withm5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=1,last_index=-1)
-    from_stacking_withm3om5_read_stats_from_csv('ResultsfromStackingwithm3oandm5.csv')
-    refine_stats_from_Stacking_A_only_withm3o_withm5()
-    from_stacking_withm3om5increased_read_stats_from_csv('ResultsfromStackingwithm3oandm5increased.csv')
-elif e == 3:
-    stacking_vs_BP_A_only_nom3o_nom5(n=50, iteration=args.n,theta=3,min_helix=3, restart=1,last_index=-1)
-    stacking_vs_BP_read_stats_from_csv('ResultsStackingvsBP.csv')
-
+parser.add_argument('-w', '--workers', type=int, default=1, help="The number of processes running the iterations, default is 1")
+parser.add_argument('-s', '--seed', type=int, default=None, help="The base seed from which each iteration gets its own random generator, results are then reproducible whatever the number of workers")
+parser.add_argument('-c', '--turner_cache', type=str, default="turner_cache.sqlite", help="The SQLite file caching the Turner folds across runs, shared by all the runs given it, 'none' to disable it, default is turner_cache.sqlite")
+parser.add_argument('-r', '--resume', action='store_true', help="Continue the experiment after the last iteration journaled next to its CSV file, instead of starting it again")
+parser.add_argument('--store', action='store_true', help="Also convert the CSV files of results to columnar NumPy stores (.npz) at the end of the experiment")
+parser.add_argument('--lazy_turner', action='store_true', help="Only enumerate the co-optimal Turner structures of the sequences whose MFE structure is the target, the CSV files are then suffixed with _lazyturner")
+parser.add_argument('--turner_cache_size', type=int, default=1000000, help="The number of Turner folds kept in the cache, the least recently used are evicted beyond it, default is 1000000")
 
+#Worker processes may import this file again, the experiments are only launched from the main process.
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.turner_cache == "none":
+        set_turner_cache(None)
+    else:
+        set_turner_cache(args.turner_cache, max_entries=args.turner_cache_size)
+    e = 0
+    if args.experiment == "FromStackingNoLargeLoop":
+        e = 0
+    elif args.experiment == "FromSeparableNoLargeLoop":
+        e = 1
+    elif args.experiment == "FromStackingOnlyLargeLoop":
+        e = 2
+    elif args.experiment == "StackingVsBP":
+        e = 3
 
+    #structure = "((((((((((((((((((((....))))))))((((((((((((....))))))))((((((((((....))))))))))((((((.........))))))))))(((((.........)))))))))))))))))(((((((((((((((((((.........)))))((((((((.........))))))))((((((((....))))))))))))((((((((....))))))))((((((((((....))))))))))))))))))))"
 
+    if e == 0:
+        restart, last_index = resume_point(results_name('ResultsfromStacking.csv', args.lazy_turner), args.resume)
+        create_stats_from_Stacking_A_only_nom3o_nom5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=restart,last_index=last_index, workers=args.workers, seed=args.seed, lazy_turner=args.lazy_turner)
+        from_stacking_read_stats_from_csv(results_name('ResultsfromStacking.csv', args.lazy_turner))
+        results = [results_name('ResultsfromStacking.csv', args.lazy_turner)]
+    elif e == 1:
+        restart, last_index = resume_point(results_name('ResultsfromSeparable.csv', args.lazy_turner), args.resume)
+        create_stats_from_Separable_A_only_nom3o_nom5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=restart,last_index=last_index, workers=args.workers, seed=args.seed, lazy_turner=args.lazy_turner)
+        from_separable_read_stats_from_csv(results_name('ResultsfromSeparable.csv', args.lazy_turner))
+        results = [results_name('ResultsfromSeparable.csv', args.lazy_turner)]
+    elif e == 2:
+        restart, last_index = resume_point(results_name('ResultsfromStackingwithm3oandm5.csv', args.lazy_turner), args.resume)
+        create_stats_from_Stacking_A_only_withm3o_withm5(n=args.n, iteration=2000,theta=3,min_helix=3, restart=restart,last_index=last_index, workers=args.workers, seed=args.seed, lazy_turner=args.lazy_turner)
+        from_stacking_withm3om5_read_stats_from_csv(results_name('ResultsfromStackingwithm3oandm5.csv', args.lazy_turner))
+        #The refinement can only be continued if the rows it refines were kept.
+        restart, last_index = resume_point(results_name('ResultsfromStackingwithm3oandm5increased.csv', args.lazy_turner), args.resume and not restart)
+        store = None
+        if args.store:
+            #The refinement then reads the rows to refine from the store rather than from the CSV file.
+            store = results_name('ResultsfromStackingwithm3oandm5.csv', args.lazy_turner)[:-len(".csv")] + ".npz"
+            csv_to_store(results_name('ResultsfromStackingwithm3oandm5.csv', args.lazy_turner), store)
+            print("store", store)
+        refine_stats_from_Stacking_A_only_withm3o_withm5(restart=restart,last_index=last_index, workers=args.workers, seed=args.seed, store=store, lazy_turner=args.lazy_turner)
+        from_stacking_withm3om5increased_read_stats_from_csv(results_name('ResultsfromStackingwithm3oandm5increased.csv', args.lazy_turner))
+        results = [results_name('ResultsfromStackingwithm3oandm5increased.csv', args.lazy_turner)]
+    elif e == 3:
+        restart, last_index = resume_point(results_name('ResultsStackingvsBP.csv', args.lazy_turner), args.resume)
+        stacking_vs_BP_A_only_nom3o_nom5(n=50, iteration=args.n,theta=3,min_helix=3, restart=restart,last_index=last_index, workers=args.workers, seed=args.seed, lazy_turner=args.lazy_turner)
+        stacking_vs_BP_read_stats_from_csv(results_name('ResultsStackingvsBP.csv', args.lazy_turner))
+        results = [results_name('ResultsStackingvsBP.csv', args.lazy_turner)]
+    if args.store:
+        for name in results:
+            csv_to_store(name, name[:-len(".csv")] + ".npz")
+            print("store", name[:-len(".csv")] + ".npz")
+    print("Turner cache", turner_cache_stats())
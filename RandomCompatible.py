@@ -2,6 +2,7 @@
 # Copyright (C) 2026 THEO BOURY 
 
 import random
+from checkSeparability import as_flat_tree, flat_span, LEAF, PAIR
 def children(v):
     """
     Input:
@@ -28,24 +29,24 @@ def is_leaf(v):
 def choose_random_seq(t, withA=True):
     """
     Input:
-        * t, a tree 
+        * t, a tree, nested or flat
         * withA, a boolean to say if we place only A on the unpaired positions or not
     Output:
         * A random sequence compatible with the tree t
     """
-    def seq_from_tree(v):
-        if is_leaf(v):
+    t = as_flat_tree(t)
+    (start, size) = flat_span(t)
+    res = ['' for _ in range(size)]
+    #Nodes are numbered in preorder, random choices are made in the same order as a recursive walk of the tree.
+    for w in range(len(t.name)):
+        if t.kind[w] == LEAF:
             if withA:
-                return "A"
+                res[t.name[w][0] - start] = "A"
             else:
-                return random.choice(["A", "G", "C", "U"])
+                res[t.name[w][0] - start] = random.choice(["A", "G", "C", "U"])
         else:
-            res = ""
             BP = random.choice(["AU","UA", "GC", "CG"])
-            for w in children(v):
-                res= res + seq_from_tree(w)
-            if v[0] == "root":
-                return res
-            else:
-                return BP[0] + res + BP[1]
-    return seq_from_tree(t)
+            if t.kind[w] == PAIR:
+                res[t.name[w][0] - start] = BP[0]
+                res[t.name[w][1] - start] = BP[1]
+    return "".join(res)
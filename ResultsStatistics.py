@@ -0,0 +1,86 @@
+# positioningempiricalmaxstacksdesigns
+# Copyright (C) 2026 THEO BOURY
+
+#This file contains the aggregation of the CSV files of results written by the experiments.
+#Rows are read lazily, one at a time, and all the statistics are computed in a single pass.
+#The results of an experiment may be split into several shards (from parallel or multi-node runs):
+#they are read one after the other, as a single file, without being concatenated first.
+
+import csv
+from math import nan
+
+
+def shard_names(names):
+    """
+    Input:
+        * names, a CSV file of results or a list of shards of the same experiment
+    Output:
+        * The list of the files to read
+    """
+    if isinstance(names, str):
+        return [names]
+    return list(names)
+
+
+def read_rows(names):
+    """
+    Input:
+        * names, a CSV file of results or a list of shards of the same experiment
+    Output:
+        * A generator over the rows of all the shards, as dictionaries from the columns of the header to the values.
+          Each shard starts with its header, the shards must share the same one
+    """
+    header = None
+    for name in shard_names(names):
+        with open(name, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
+            shard_header = next(reader, None)
+            if shard_header is None:
+                continue
+            if header is None:
+                header = shard_header
+            elif shard_header != header:
+                raise ValueError("The shard " + name + " does not have the columns of the previous ones")
+            for row in reader:
+                if row != []:
+                    yield dict(zip(header, row))
+
+
+def aggregate(names, tables=(), means=()):
+    """
+    Input:
+        * names, a CSV file of results or a list of shards of the same experiment
+        * tables, a list of tuples of columns, for which the contingency table is computed
+        * means, a list of numerical columns, for which the mean is computed
+    Output:
+        * A dictionary with the number of rows ("rows"), for each tuple of columns of tables the number of rows with
+          each tuple of values ("tables"), and the mean of each column of means, nan without rows ("means")
+    """
+    counts = {columns: {} for columns in tables}
+    sums = {column: 0 for column in means}
+    nb = 0
+    for row in read_rows(names):
+        nb += 1
+        for columns in tables:
+            values = tuple(row[column] for column in columns)
+            counts[columns][values] = counts[columns].get(values, 0) + 1
+        for column in means:
+            sums[column] += float(row[column])
+    resu = {"rows": nb, "tables": counts, "means": {}}
+    for column in means:
+        resu["means"][column] = nan
+        if nb > 0:
+            resu["means"][column] = sums[column] / nb
+    return resu
+
+
+def count(stats, columns, values):
+    """
+    Input:
+        * stats, the output of aggregate
+        * columns, a tuple of columns of its tables
+        * values, a tuple of values of these columns
+    Output:
+        * The number of rows with these values
+    """
+    return stats["tables"][columns].get(values, 0)
@@ -0,0 +1,325 @@
+# positioningempiricalmaxstacksdesigns
+# Copyright (C) 2026 THEO BOURY
+
+#This file contains a columnar binary store for the results of the experiments, as an alternative to the CSV files.
+#A store is a NumPy .npz file with, for each column of the CSV file:
+# - "bool", the "True"/"False" values packed 8 per byte,
+# - "int" or "float", the numerical values,
+# - "sequence" and "structure", the strings over ACGU or over .() packed 4 symbols per byte, with the offset of each row,
+# - "text", the strings as they are, for any other column.
+#The kinds of the columns of the experiments are known from their names, the kind of any other column is guessed from its values.
+#The rows are streamed: the columns are converted to arrays by chunks as the rows are read.
+#The target structures (column "ss") are stored once each: the rows only keep the index of their structure,
+#so that all the rows of a structure are found without comparing strings.
+#Analyses then load whole columns as arrays instead of parsing text.
+
+import csv
+from array import array
+
+import numpy as np
+
+from ResultsStatistics import read_rows, shard_names
+
+#Alphabets of the strings packed with 2 bits per symbol.
+ALPHABETS = {"sequence": "ACGU", "structure": ".()"}
+
+#Column of the target structures, indexed by structure.
+STRUCTURE_COLUMN = "ss"
+
+
+#Kinds of the columns written by the experiments, the other columns get the kind guessed from their values by column_kind.
+COLUMN_KINDS = {"ss": "structure", "Turnerfold": "structure", "StackingFold": "structure", "BPfold": "structure",
+                "random_compatible_Turnerfold": "structure", "Stacking_TurnerFold": "structure", "BP_TurnerFold": "structure",
+                "seq": "sequence", "random_compatible_seq": "sequence", "Stacking_seq": "sequence", "BP_seq": "sequence",
+                "Separable(Aonly)": "bool", "BPDesign": "bool", "StackingDesign": "bool", "TurnerDesign": "bool",
+                "random_compatible_TurnerDesign": "bool", "Stacking_TurnerDesign": "bool", "BP_TurnerDesign": "bool",
+                "nb_it_more_for_finding_BP": "int", "modulo": "int", "leaf_levels": "int"}
+
+#Number of rows converted to arrays at once while the rows are streamed.
+CHUNK_ROWS = 10000
+
+
+def column_kind(values):
+    """
+    Input:
+        * values, the list of the values of a column, as strings
+    Output:
+        * The kind of the column guessed from its values: "bool", "int", "float", "sequence", "structure" or "text"
+    """
+    if values == []:
+        return "text"
+    if all(val in ["True", "False"] for val in values):
+        return "bool"
+    for (kind, convert) in [("int", int), ("float", float)]:
+        try:
+            for val in values:
+                convert(val)
+            return kind
+        except ValueError:
+            pass
+    letters = set("".join(values))
+    if letters == set():
+        return "text"
+    for kind in ["sequence", "structure"]:
+        if letters.issubset(set(ALPHABETS[kind])):
+            return kind
+    return "text"
+
+
+def string_codes(values, alphabet):
+    """
+    Input:
+        * values, a list of strings
+        * alphabet, at most 4 symbols
+    Output:
+        * The codes of all the symbols of the strings, one after the other, raises ValueError for a symbol out of alphabet
+    """
+    lookup = np.full(256, 255, dtype=np.uint8)
+    for code, letter in enumerate(alphabet):
+        lookup[ord(letter)] = code
+    codes = lookup[np.frombuffer("".join(values).encode("ascii", errors="replace"), dtype=np.uint8)]
+    if (codes == 255).any():
+        raise ValueError("A value is not a string over " + alphabet)
+    return codes
+
+
+def pack_codes(codes):
+    """
+    Input:
+        * codes, an array of codes of 2 bits, of a length multiple of 4
+    Output:
+        * The codes packed 4 per byte
+    """
+    return (codes[0::4] << 6) | (codes[1::4] << 4) | (codes[2::4] << 2) | codes[3::4]
+
+
+def pack_strings(values, alphabet):
+    """
+    Input:
+        * values, a list of strings over alphabet
+        * alphabet, at most 4 symbols
+    Output:
+        * The codes of all the symbols, one after the other, packed 4 per byte, and the offset of each string in them
+    """
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(val) for val in values])
+    codes = string_codes(values, alphabet)
+    codes = np.concatenate([codes, np.zeros((-len(codes)) % 4, dtype=np.uint8)])
+    return pack_codes(codes), offsets
+
+
+def unpack_strings(packed, offsets, alphabet):
+    """
+    Input:
+        * packed, offsets, as returned by pack_strings
+        * alphabet, the alphabet used to pack them
+    Output:
+        * The list of the strings
+    """
+    codes = np.stack([(packed >> shift) & 3 for shift in [6, 4, 2, 0]], axis=1).reshape(-1)
+    letters = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)[codes[:offsets[-1]]]
+    text = letters.tobytes().decode("ascii")
+    return [text[offsets[k]:offsets[k + 1]] for k in range(len(offsets) - 1)]
+
+
+def new_column(kind):
+    """
+    Input:
+        * kind, the kind of a column, None to guess it from all its values
+    Output:
+        * An empty column, filled by add_value and converted to arrays by flush_column and column_arrays
+    """
+    return {"kind": kind, "pending": [], "chunks": [], "lengths": [], "leftover": np.zeros(0, dtype=np.uint8), "nb": 0}
+
+
+def add_value(column, val):
+    """
+    Input:
+        * column, as returned by new_column
+        * val, the next value of the column, as a string
+    Output:
+        * Adds val to the column, the pending values being converted to an array every CHUNK_ROWS values
+    """
+    column["pending"].append(val)
+    column["nb"] += 1
+    if len(column["pending"]) >= CHUNK_ROWS and column["kind"] is not None:
+        flush_column(column)
+
+
+def flush_column(column):
+    """
+    Input:
+        * column, as returned by new_column, with a known kind
+    Output:
+        * Converts the pending values of the column to a chunk of array. The strings are packed, the last codes
+          not filling a byte being kept for the next chunk
+    """
+    kind = column["kind"]
+    values = column["pending"]
+    column["pending"] = []
+    if kind == "bool":
+        if any(val not in ["True", "False"] for val in values):
+            raise ValueError("A value is not a boolean")
+        column["chunks"].append(np.array([val == "True" for val in values], dtype=bool))
+    elif kind == "int":
+        column["chunks"].append(np.array([int(val) for val in values], dtype=np.int64))
+    elif kind == "float":
+        column["chunks"].append(np.array([float(val) for val in values], dtype=np.float64))
+    elif kind in ALPHABETS:
+        codes = np.concatenate([column["leftover"], string_codes(values, ALPHABETS[kind])])
+        full = len(codes) - len(codes) % 4
+        column["chunks"].append(pack_codes(codes[:full]))
+        column["leftover"] = codes[full:]
+        column["lengths"].append(np.array([len(val) for val in values], dtype=np.int64))
+    else:
+        column["chunks"].append(np.array(values, dtype=str))
+
+
+def column_arrays(column, key, arrays):
+    """
+    Input:
+        * column, as returned by new_column, with all its values
+        * key, the prefix of the arrays of the column in the store
+        * arrays, the arrays of the store
+    Output:
+        * Adds the arrays of the column to arrays and returns its kind
+    """
+    if column["kind"] is None:
+        column["kind"] = column_kind(column["pending"])
+    if column["pending"] != [] or column["chunks"] == []:
+        flush_column(column)
+    kind = column["kind"]
+    arrays[key + "_nb"] = np.array(column["nb"])
+    if kind == "bool":
+        arrays[key] = np.packbits(np.concatenate(column["chunks"]))
+    elif kind in ALPHABETS:
+        leftover = column["leftover"]
+        last = pack_codes(np.concatenate([leftover, np.zeros((-len(leftover)) % 4, dtype=np.uint8)]))
+        arrays[key] = np.concatenate(column["chunks"] + [last])
+        offsets = np.zeros(column["nb"] + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.concatenate(column["lengths"]))
+        arrays[key + "_offsets"] = offsets
+    else:
+        arrays[key] = np.concatenate(column["chunks"])
+    return kind
+
+
+def write_store(name, header, rows):
+    """
+    Input:
+        * name, the .npz file of the store
+        * header, the columns
+        * rows, an iterable over the rows, each one a list of strings following header, read once
+    Output:
+        * Writes the store of the rows in name, the columns being built as the rows are read.
+          The kind of a column is given by COLUMN_KINDS, or guessed from its values for the other columns
+    """
+    columns = [new_column(COLUMN_KINDS.get(column)) for column in header]
+    #The target structures are stored once each, in the order of their first row, along with the index of the structure of each row.
+    index = {}
+    ids = array("q")
+    nb = 0
+    for row in rows:
+        nb += 1
+        for k, column in enumerate(header):
+            val = row[k]
+            if column == STRUCTURE_COLUMN:
+                if val not in index:
+                    index[val] = len(index)
+                    add_value(columns[k], val)
+                ids.append(index[val])
+            else:
+                add_value(columns[k], val)
+    arrays = {"columns": np.array(header), "nb_rows": np.array(nb)}
+    kinds = []
+    for k, column in enumerate(header):
+        key = "col" + str(k)
+        kinds.append(column_arrays(columns[k], key, arrays))
+        if column == STRUCTURE_COLUMN:
+            arrays[key + "_ids"] = np.array(ids, dtype=np.int64)
+    arrays["kinds"] = np.array(kinds)
+    with open(name, "wb") as storefile:
+        np.savez_compressed(storefile, **arrays)
+
+
+def csv_to_store(names, store_name):
+    """
+    Input:
+        * names, a CSV file of results or a list of shards of the same experiment
+        * store_name, the .npz file of the store
+    Output:
+        * Writes the store of all the rows of the shards in store_name, the rows being streamed from the shards
+    """
+    with open(shard_names(names)[0], "r", newline="") as csvfile:
+        header = next(csv.reader(csvfile, delimiter=' ', quotechar='|'), [])
+    write_store(store_name, header, ([row[column] for column in header] for row in read_rows(names)))
+
+
+def load_store(name):
+    """
+    Input:
+        * name, the .npz file of a store
+    Output:
+        * The store, a dictionary of its arrays, loaded once
+    """
+    with np.load(name) as data:
+        return {key: data[key] for key in data.files}
+
+
+def column_values(store, k):
+    """
+    Input:
+        * store, as returned by load_store
+        * k, the index of a column
+    Output:
+        * The values stored for the column: an array of booleans or numbers, a list of strings otherwise.
+          For the target structures, each structure once
+    """
+    key = "col" + str(k)
+    kind = str(store["kinds"][k])
+    if kind == "bool":
+        return np.unpackbits(store[key], count=int(store[key + "_nb"])).astype(bool)
+    if kind in ALPHABETS:
+        return unpack_strings(store[key], store[key + "_offsets"], ALPHABETS[kind])
+    if kind == "text":
+        return [str(val) for val in store[key]]
+    return store[key]
+
+
+def load_column(store, column):
+    """
+    Input:
+        * store, as returned by load_store
+        * column, one of its columns
+    Output:
+        * The values of the column for each row: an array of booleans or numbers, a list of strings otherwise
+    """
+    columns = list(store["columns"])
+    if column not in columns:
+        raise ValueError("No column " + column + " in the store")
+    k = columns.index(column)
+    values = column_values(store, k)
+    if column == STRUCTURE_COLUMN:
+        ids = store["col" + str(k) + "_ids"]
+        if isinstance(values, list):
+            return [values[i] for i in ids]
+        return values[ids]
+    return values
+
+
+def structure_rows(store):
+    """
+    Input:
+        * store, as returned by load_store
+    Output:
+        * A dictionary giving, for each target structure, the array of the indices of its rows
+    """
+    columns = list(store["columns"])
+    if STRUCTURE_COLUMN not in columns:
+        raise ValueError("No column " + STRUCTURE_COLUMN + " in the store")
+    k = columns.index(STRUCTURE_COLUMN)
+    structures = column_values(store, k)
+    ids = store["col" + str(k) + "_ids"]
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(len(structures) + 1))
+    return {structures[s]: order[bounds[s]:bounds[s + 1]] for s in range(len(structures))}
@@ -1,10 +1,48 @@
 # positioningempiricalmaxstacksdesigns
 # Copyright (C) 2026 THEO BOURY 
 
+import os
 import random 
+import tempfile
+import numpy as np
 UNPAIRED_WEIGHT = 1
 
 #Below are some functions for the random generation of secondary structures
+def sscount_fill(n,count,count_stacked,theta,min_helix):
+    """
+    Input:
+        * n, size of the secondary structures
+        * count, count_stacked, the dictionaries of sscount and sscount_stacked
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * Fills count and count_stacked for all sizes up to n, bottom-up so that any n can be reached without recursion.
+          Raises OverflowError when the counts exceed the float range
+    """
+    for k in range(0, n+1):
+        if k in count and k in count_stacked:
+            continue
+        if k<=0:
+            count[k] = 1.
+            count_stacked[k] = 1.
+            continue
+        c = UNPAIRED_WEIGHT*count[k-1]
+        if k >= theta+2*min_helix:
+            c += count_stacked[k-2*min_helix]
+        for i in range(theta+2*min_helix,k):
+            c += count_stacked[i-2*min_helix]*count[k-i]
+        c_s = UNPAIRED_WEIGHT*count[k-1]
+        if k >= theta+2:
+            c_s += count_stacked[k-2]
+        for i in range(theta+2*min_helix,k):
+            c_s += count_stacked[i-2*min_helix]*count[k-i]
+        #Infinite counts would bias all the draws of ssrandom, the log-space counts have no such limit.
+        if c == np.inf or c_s == np.inf:
+            raise OverflowError("The number of secondary structures of size " + str(k) + " exceeds the float range, use ssrandom_filtered with large_loop=None")
+        count[k] = c
+        count_stacked[k] = c_s
+
+
 def sscount(n,count,count_stacked,theta,min_helix):
     """
     Input:
@@ -16,15 +54,10 @@ def sscount(n,count,count_stacked,theta,min_helix):
     Output:
         * An int, number of secondary structures of size n
     """
+    if n<=0:
+        return 1.
     if n not in count:
-        if n<=0:
-            count[n] = 1.
-        else:
-            count[n] = UNPAIRED_WEIGHT*sscount(n-1,count,count_stacked,theta,min_helix)
-            if n >= theta+2*min_helix:
-                count[n] += sscount_stacked(n-2*min_helix,count,count_stacked,theta,min_helix)
-            for i in range(theta+2*min_helix,n):
-                count[n] += sscount_stacked(i-2*min_helix,count,count_stacked,theta,min_helix)*sscount(n-i,count,count_stacked,theta,min_helix)
+        sscount_fill(n,count,count_stacked,theta,min_helix)
     return count[n]
 
 
@@ -39,15 +72,10 @@ def sscount_stacked(n,count,count_stacked,theta,min_helix):
     Output:
         * An int, number of secondary structures that finish by a base pair of size n
     """
+    if n<=0:
+        return 1.
     if n not in count_stacked:
-        if n<=0:
-            count_stacked[n] = 1.
-        else:
-            count_stacked[n] = UNPAIRED_WEIGHT*sscount(n-1,count,count_stacked,theta,min_helix)
-            if n >= theta+2:
-                count_stacked[n] += sscount_stacked(n-2,count,count_stacked,theta,min_helix)
-            for i in range(theta+2*min_helix,n):
-                count_stacked[n] += sscount_stacked(i-2*min_helix,count,count_stacked,theta,min_helix)*sscount(n-i,count,count_stacked,theta,min_helix)
+        sscount_fill(n,count,count_stacked,theta,min_helix)
     return count_stacked[n]
 
 
@@ -105,3 +133,353 @@ def ssrandom_stacked(n,count,count_stacked,theta,min_helix):
             r -= sscount_stacked(i-2*min_helix,count,count_stacked,theta,min_helix)*sscount(n-i,count,count_stacked,theta,min_helix)
             if r<0:
                 return '('*min_helix+ssrandom_stacked(i-2*min_helix,count,count_stacked,theta,min_helix)+')'*min_helix+ssrandom(n-i,count,count_stacked,theta,min_helix)
+
+
+#Below are the counting and the random generation of secondary structures with or without large loops, see filter in checkSeparability.
+#A node of the tree is a base pair (or the root) and its children are the base pairs and unpaired positions directly enclosed.
+#A structure has no large loop if each base pair has at most 3 base pair children, and at most 1 if it also has unpaired children.
+#The root is allowed at most 4 base pair children, and at most 2 with unpaired children.
+#Counting states (h, u) along the children of a node: h its number of base pair children so far (capped at DEAD_STATE), u whether it has unpaired children.
+DEAD_STATE = 5
+STATES = [(h, u) for h in range(DEAD_STATE + 1) for u in range(2)]
+
+
+def allowed_state(h, u, root):
+    """
+    Input:
+        * h, u, a counting state of the children of a node
+        * root, if the node is the root
+    Output:
+        * A boolean, if a node with these children respects the limits on large loops
+    """
+    if root:
+        return h <= 2 or (h <= 4 and u == 0)
+    return h <= 1 or (h <= 3 and u == 0)
+
+
+#Columns of the array of count tables, each of the tables of a node's children taking one column per state.
+TABLE_COLUMNS = {"all": 0, "all_stacked": 1, "good_stacked": 2, "good_inner": 3, "good_root": 3 + len(STATES)}
+NB_COLUMNS = 3 + 2*len(STATES)
+
+#Directory of the count tables saved by load_count_tables. The path is made absolute at import, so that it does not depend on later changes of directory.
+COUNT_TABLES_DIR = os.path.abspath("count_tables")
+
+
+def count_tables_views(arr):
+    """
+    Input:
+        * arr, an array of count tables of shape (n+1, NB_COLUMNS)
+    Output:
+        * The dictionary of the tables of sscount_filtered, as views on arr. The tables of the children of a node are indexed by [k][(h, u)]
+    """
+    tables = {}
+    for name in ["all", "all_stacked", "good_stacked"]:
+        tables[name] = arr[:, TABLE_COLUMNS[name]]
+    for name in ["good_inner", "good_root"]:
+        c = TABLE_COLUMNS[name]
+        tables[name] = arr[:, c:c+len(STATES)].reshape(len(arr), DEAD_STATE+1, 2)
+    return tables
+
+
+def logsumexp(x, axis=None):
+    """
+    Input:
+        * x, an array of logarithms
+        * axis, the axis to sum over, all of them by default
+    Output:
+        * The logarithm of the sum of the exponentials of x, computed without overflow. It is -inf for an empty sum
+    """
+    x = np.asarray(x)
+    if x.size == 0:
+        return -np.inf
+    m = np.max(x, axis=axis, keepdims=True)
+    m = np.where(np.isfinite(m), m, 0.)
+    with np.errstate(divide="ignore"):
+        resu = np.log(np.sum(np.exp(x - m), axis=axis, keepdims=True)) + m
+    if axis is None:
+        return resu.item()
+    return np.squeeze(resu, axis=axis)
+
+
+def logminus(la, lb):
+    """
+    Input:
+        * la, lb, the logarithms of two numbers a >= b
+    Output:
+        * The logarithm of a-b
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(lb < la, la + np.log1p(-np.exp(lb - la)), -np.inf)
+
+
+def build_count_tables(n,theta,min_helix):
+    """
+    Input:
+        * n, size of the secondary structures
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * The array of the logarithms of the count tables of sscount_filtered for all sizes up to n, filled bottom-up.
+          Counts are accumulated in log-space, so that they never overflow whatever n
+    """
+    m = min_helix
+    lw = np.log(UNPAIRED_WEIGHT) if UNPAIRED_WEIGHT > 0 else -np.inf
+    arr = np.full((n+1, NB_COLUMNS), -np.inf)
+    tables = count_tables_views(arr)
+    A, AS, GS = tables["all"], tables["all_stacked"], tables["good_stacked"]
+    GI = tables["good_inner"]
+    nh = [min(h+1, DEAD_STATE) for h in range(DEAD_STATE+1)]
+    nodes = []
+    for root in [False, True]:
+        G = tables["good_root"] if root else GI
+        mask = np.array([[allowed_state(h, u, root) for u in range(2)] for h in range(DEAD_STATE+1)])
+        G[0] = np.where(mask, 0., -np.inf)
+        nodes.append((G, mask))
+    A[0] = 0.
+    AS[0] = 0.
+    GS[0] = 0.
+    for k in range(1, n+1):
+        a = [[lw + A[k-1]]]
+        a_s = [[lw + A[k-1]]]
+        g_s = [[lw + GI[k-1][(0, 1)]]]
+        if k >= theta+2:
+            a_s.append([AS[k-2]])
+            g_s.append([GS[k-2]])
+        #A helix of size i >= theta+2*min_helix is put first, with its content of size i-2*min_helix, and k-i positions left after it.
+        #Summed over i, with j = k-2*min_helix-theta the largest number of positions left after the smallest helix.
+        j = k-2*m-theta
+        if j >= 0:
+            a.append(AS[theta:k-2*m+1] + A[j::-1])
+            a_s.append(AS[theta:k-2*m] + A[j:0:-1])
+            g_s.append(GS[theta:k-2*m] + GI[j:0:-1, 1, 0])
+        A[k] = logsumexp(np.concatenate(a))
+        AS[k] = logsumexp(np.concatenate(a_s))
+        GS[k] = logsumexp(np.concatenate(g_s))
+        for (G, mask) in nodes:
+            terms = [lw + G[k-1][:, [1, 1]][None]]
+            if j >= 0:
+                terms.append(GS[theta:k-2*m+1][:, None, None] + G[j::-1][:, nh, :])
+            G[k] = np.where(mask, logsumexp(np.concatenate(terms), axis=0), -np.inf)
+    return arr
+
+
+def load_count_tables(n,theta,min_helix,directory=None):
+    """
+    Input:
+        * n, size of the secondary structures
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+        * directory, where the tables are saved, COUNT_TABLES_DIR by default
+    Output:
+        * The dictionary of the tables of sscount_filtered up to size n, memory-mapped from a file keyed by (n, theta, min_helix, UNPAIRED_WEIGHT).
+          The file is built and saved on the first use, later runs and worker processes read it without building it again
+    """
+    if directory is None:
+        directory = COUNT_TABLES_DIR
+    name = "sslogcount_n%d_theta%d_helix%d_weight%s.npy"
+    path = os.path.join(directory, name % (n, theta, min_helix, UNPAIRED_WEIGHT))
+    #The tables up to a larger size contain those up to n.
+    if os.path.isdir(directory):
+        sizes = [int(f.split("_")[1][1:]) for f in os.listdir(directory) if f.startswith("sslogcount_n") and f.endswith(name[name.index("_theta"):] % (theta, min_helix, UNPAIRED_WEIGHT))]
+        sizes = [size for size in sizes if size >= n]
+        if sizes != []:
+            path = os.path.join(directory, name % (min(sizes), theta, min_helix, UNPAIRED_WEIGHT))
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        arr = build_count_tables(n,theta,min_helix)
+        #Written aside then renamed, so that processes building the same tables at once never read a partial file.
+        (fd, tmppath) = tempfile.mkstemp(dir=directory, suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmppath, path)
+    return count_tables_views(np.load(path, mmap_mode="r"))
+
+
+def sslogcount_filtered(n,tables,theta,min_helix):
+    """
+    Input:
+        * n, size of the secondary structures
+        * tables, a dictionary of count tables. It starts empty, is loaded by load_count_tables and can be reused for any smaller size
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * The logarithm of the number of secondary structures of size n with no large loop. The tables contain the logarithms of:
+          - "all" and "all_stacked", the counts of sscount and sscount_stacked
+          - "good_stacked", the count of the content of a base pair with no large loop
+          - "good_inner" and "good_root", for each size k and state (h, u), the number of ways to end the children of a node
+            (a base pair or the root) on k positions with no large loop
+    """
+    if tables == {} or len(tables["all"]) <= n:
+        tables.clear()
+        tables.update(load_count_tables(n,theta,min_helix))
+    return float(tables["good_root"][n][(0, 0)])
+
+
+def sscount_filtered(n,tables,theta,min_helix):
+    """
+    Input:
+        * n, size of the secondary structures
+        * tables, a dictionary of count tables, see sslogcount_filtered
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * The number of secondary structures of size n with no large loop, as a float (inf beyond the float range)
+    """
+    with np.errstate(over="ignore"):
+        return float(np.exp(sslogcount_filtered(n,tables,theta,min_helix)))
+
+
+def ssfiltered_logweight(task,tables):
+    """
+    Input:
+        * task, a part of a structure to generate: (kind, k) or (kind, k, h, u, root) with kind among
+          "all" and "all_stacked" (no constraint), "good_inner", "good_stacked" (no large loop), "bad_inner", "bad_stacked" (at least one large loop)
+        * tables, the count tables filled by sslogcount_filtered
+    Output:
+        * The logarithm of the number of ways to generate task
+    """
+    kind, k = task[0], task[1]
+    if kind in ["all", "all_stacked", "good_stacked"]:
+        return tables[kind][k]
+    if kind == "bad_stacked":
+        return logminus(tables["all_stacked"][k], tables["good_stacked"][k])
+    (h, u, root) = task[2:]
+    G = tables["good_root"] if root else tables["good_inner"]
+    if kind == "good_inner":
+        return G[k][(h, u)]
+    return logminus(tables["all"][k], G[k][(h, u)])
+
+
+def ssfiltered_choices(task,tables,theta,min_helix):
+    """
+    Input:
+        * task, a part of a structure to generate, see ssfiltered_logweight
+        * tables, the count tables filled by sslogcount_filtered
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * The list of the families of decompositions of task, as (logweights, pieces) with logweights an array over the contents c of
+          the first helix (or a single value) and pieces(c) the strings and tasks to generate from left to right
+    """
+    A, AS, GS = tables["all"], tables["all_stacked"], tables["good_stacked"]
+    m = min_helix
+    lw = np.log(UNPAIRED_WEIGHT) if UNPAIRED_WEIGHT > 0 else -np.inf
+    kind, k = task[0], task[1]
+    if k <= 0:
+        return []
+    #A first helix, of size up to k (or k-1 inside a base pair, the whole content being a stacking), leaves k-2*min_helix-c positions after its content c.
+    last = k-2*m
+    if kind in ["all_stacked", "good_stacked", "bad_stacked"]:
+        last = k-2*m-1
+    cs = np.arange(theta, last+1)
+    choices = []
+    if kind in ["all", "all_stacked"]:
+        choices.append(([lw + A[k-1]], lambda c: ['.', ("all", k-1)]))
+        if kind == "all_stacked" and k >= theta+2:
+            choices.append(([AS[k-2]], lambda c: ['(', ("all_stacked", k-2), ')']))
+        choices.append((AS[cs] + A[k-2*m-cs], lambda c: ['('*m, ("all_stacked", c), ')'*m, ("all", k-2*m-c)]))
+    elif kind in ["good_stacked", "bad_stacked"]:
+        GI = tables["good_inner"]
+        if kind == "good_stacked":
+            choices.append(([lw + GI[k-1][(0, 1)]], lambda c: ['.', ("good_inner", k-1, 0, 1, False)]))
+            if k >= theta+2:
+                choices.append(([GS[k-2]], lambda c: ['(', ("good_stacked", k-2), ')']))
+            choices.append((GS[cs] + GI[k-2*m-cs, 1, 0], lambda c: ['('*m, ("good_stacked", c), ')'*m, ("good_inner", k-2*m-c, 1, 0, False)]))
+        else:
+            choices.append(([lw + logminus(A[k-1], GI[k-1][(0, 1)])], lambda c: ['.', ("bad_inner", k-1, 0, 1, False)]))
+            if k >= theta+2:
+                choices.append(([logminus(AS[k-2], GS[k-2])], lambda c: ['(', ("bad_stacked", k-2), ')']))
+            #Either the new helix contains a large loop, or it does not and the large loop comes after.
+            choices.append((logminus(AS[cs], GS[cs]) + A[k-2*m-cs], lambda c: ['('*m, ("bad_stacked", c), ')'*m, ("all", k-2*m-c)]))
+            choices.append((GS[cs] + logminus(A[k-2*m-cs], GI[k-2*m-cs, 1, 0]), lambda c: ['('*m, ("good_stacked", c), ')'*m, ("bad_inner", k-2*m-c, 1, 0, False)]))
+    else:
+        (h, u, root) = task[2:]
+        G = tables["good_root"] if root else tables["good_inner"]
+        nh = min(h+1, DEAD_STATE)
+        if kind == "good_inner":
+            choices.append(([lw + G[k-1][(h, 1)]], lambda c: ['.', ("good_inner", k-1, h, 1, root)]))
+            choices.append((GS[cs] + G[k-2*m-cs, nh, u], lambda c: ['('*m, ("good_stacked", c), ')'*m, ("good_inner", k-2*m-c, nh, u, root)]))
+        else:
+            choices.append(([lw + logminus(A[k-1], G[k-1][(h, 1)])], lambda c: ['.', ("bad_inner", k-1, h, 1, root)]))
+            choices.append((logminus(AS[cs], GS[cs]) + A[k-2*m-cs], lambda c: ['('*m, ("bad_stacked", c), ')'*m, ("all", k-2*m-c)]))
+            choices.append((GS[cs] + logminus(A[k-2*m-cs], G[k-2*m-cs, nh, u]), lambda c: ['('*m, ("good_stacked", c), ')'*m, ("bad_inner", k-2*m-c, nh, u, root)]))
+    return [(np.asarray(logweights, dtype=float).reshape(-1), pieces) for (logweights, pieces) in choices]
+
+
+def ssrandom_batch(n,k,tables,theta,min_helix,large_loop=False,pair_table=False):
+    """
+    Input:
+        * n, size of the secondary structures
+        * k, the number of structures to sample
+        * tables, a dictionary of count tables, see sslogcount_filtered
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+        * large_loop, if the structures must contain a large loop (filter is False) instead of none (filter is True), None for no constraint
+        * pair_table, to get the structures as pair tables instead of strings
+    Output:
+        * A list of k secondary structures uniformly and independently sampled, see ssrandom_filtered.
+          With pair_table, an array of shape (k, n) with -1 for an unpaired position and the index of its correspondent for a paired one, as ssparse
+    """
+    sslogcount_filtered(n,tables,theta,min_helix)
+    root = ("good_inner", n, 0, 0, True)
+    if large_loop:
+        root = ("bad_inner", n, 0, 0, True)
+    elif large_loop is None:
+        root = ("all", n)
+    if ssfiltered_logweight(root,tables) == -np.inf:
+        raise ValueError("No secondary structure of size " + str(n) + " with the required large loops")
+    structures = np.full((k, n), ord('.'), dtype=np.uint8)
+    pairs = np.full((k, n), -1, dtype=np.int64)
+    for s in range(k):
+        #Each decision places at least one position, n draws are enough for a structure.
+        draws = [random.random() for _ in range(n)]
+        d = 0
+        #Tasks are generated in any order, each one knowing the position where it starts.
+        stack = [(root, 0)]
+        while stack != []:
+            (task, pos) = stack.pop()
+            choices = ssfiltered_choices(task,tables,theta,min_helix)
+            if choices == []:
+                continue
+            ltotal = ssfiltered_logweight(task,tables)
+            cumulated = np.cumsum(np.exp(np.concatenate([logweights for (logweights, _) in choices]) - ltotal))
+            #Drawn relatively to the computed sum, so that a rounding error can never select a choice of weight 0.
+            index = min(int(np.searchsorted(cumulated, draws[d]*cumulated[-1], side="right")), len(cumulated)-1)
+            d += 1
+            for (logweights, pieces) in choices:
+                if index < len(logweights):
+                    break
+                index -= len(logweights)
+            for piece in pieces(theta + index):
+                if not isinstance(piece, str):
+                    stack.append((piece, pos))
+                    pos += piece[1]
+                    continue
+                if piece[0] == '(':
+                    structures[s, pos:pos+len(piece)] = ord('(')
+                    opening = pos
+                elif piece[0] == ')':
+                    #The closing piece of a helix mirrors its opening piece.
+                    structures[s, pos:pos+len(piece)] = ord(')')
+                    t = np.arange(len(piece))
+                    pairs[s, opening+t] = pos+len(piece)-1-t
+                    pairs[s, pos+len(piece)-1-t] = opening+t
+                pos += len(piece)
+    if pair_table:
+        return pairs
+    return [row.tobytes().decode() for row in structures]
+
+
+def ssrandom_filtered(n,tables,theta,min_helix,large_loop=False):
+    """
+    Input:
+        * n, size of the secondary structures
+        * tables, a dictionary of count tables, see sslogcount_filtered
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+        * large_loop, if the structure must contain a large loop (filter is False) instead of none (filter is True), None for no constraint
+    Output:
+        * A secondary structure uniformly sampled among those of size n with no large loop, or with at least one, or among all of them.
+          The generation is iterative, without rejection, and the weights of the choices are taken relatively to the task so that they never overflow
+    """
+    return ssrandom_batch(n,1,tables,theta,min_helix,large_loop)[0]
@@ -2,7 +2,11 @@
 # Copyright (C) 2026 THEO BOURY 
 
 import random
+from bisect import bisect_right
+from collections import namedtuple
 from math import exp
+
+import numpy as np
 def ssparse(seq):
     """
     Input:
@@ -65,26 +69,146 @@ def children(v):
     """
     return v[1]
 
+#A secondary structure tree stored in flat lists indexed by the nodes, numbered in preorder (node 0 is the top of the tree):
+# - name, the name v[0] of the node in the nested tree, "root" or the interval (i, j) of a base pair, (i, i) for a leaf
+# - kind, ROOT, PAIR or LEAF
+# - parent, first_child and next_sibling, the indices of the related nodes, -1 if there is none
+# - nb_helix_children and nb_leaf_children, the numbers of base pair and leaf children of the node
+FlatTree = namedtuple("FlatTree", ["name", "kind", "parent", "first_child", "next_sibling", "nb_helix_children", "nb_leaf_children"])
+ROOT = "root"
+PAIR = "pair"
+LEAF = "leaf"
+
+
+def new_flat_tree():
+    """
+    Output:
+        * An empty flat tree
+    """
+    return FlatTree([], [], [], [], [], [], [])
+
+
+def add_flat_node(t, last_child, name, kind, parent):
+    """
+    Input:
+        * t, a flat tree under construction
+        * last_child, the list of the last child added to each node
+        * name, kind, the name and the kind of the new node
+        * parent, the index of its parent, -1 for the top of the tree
+    Output:
+        * The index of the new node, added as the last child of parent
+    """
+    v = len(t.name)
+    t.name.append(name)
+    t.kind.append(kind)
+    t.parent.append(parent)
+    t.first_child.append(-1)
+    t.next_sibling.append(-1)
+    t.nb_helix_children.append(0)
+    t.nb_leaf_children.append(0)
+    last_child.append(-1)
+    if parent != -1:
+        if last_child[parent] == -1:
+            t.first_child[parent] = v
+        else:
+            t.next_sibling[last_child[parent]] = v
+        last_child[parent] = v
+        if kind == LEAF:
+            t.nb_leaf_children[parent] += 1
+        else:
+            t.nb_helix_children[parent] += 1
+    return v
+
+
+def dbn_to_flat_tree(dbn):
+    """
+    Input:
+       * dbn, a list with -1 for an unpaired position and the index of its correspondent for a paired position
+    Output:
+       * The flat tree of the structure, the same tree as dbn_to_tree, built iteratively
+    """
+    t = new_flat_tree()
+    last_child = []
+    add_flat_node(t, last_child, "root", ROOT, -1)
+    stack = [0]
+    for i in range(len(dbn)):
+        if dbn[i] == -1:
+            add_flat_node(t, last_child, (i,i), LEAF, stack[-1])
+        elif dbn[i] > i:
+            stack.append(add_flat_node(t, last_child, (i,dbn[i]), PAIR, stack[-1]))
+        else:
+            stack.pop()
+    return t
+
+
+def as_flat_tree(v):
+    """
+    Input:
+       * v, a secondary structure tree, nested (as built by dbn_to_tree) or flat
+    Output:
+       * The flat tree of v, converted iteratively if v is nested
+    """
+    if isinstance(v, FlatTree):
+        return v
+    t = new_flat_tree()
+    last_child = []
+    stack = [(v, -1)]
+    while stack != []:
+        (w, parent) = stack.pop()
+        kind = PAIR
+        if w[0] == "root":
+            kind = ROOT
+        elif is_leaf(w):
+            kind = LEAF
+        node = add_flat_node(t, last_child, w[0], kind, parent)
+        for ww in reversed(w[1]):
+            stack.append((ww, node))
+    return t
+
+
+def flat_span(t):
+    """
+    Input:
+       * t, a flat tree
+    Output:
+       * The first position covered by the tree and its number of positions
+    """
+    if t.kind[0] != ROOT:
+        return t.name[0][0], t.name[0][1] - t.name[0][0] + 1
+    return 0, sum(1 if t.kind[w] == LEAF else 2 for w in range(1, len(t.name)))
+
+
+def flat_children(t, v):
+    """
+    Input:
+       * t, a flat tree
+       * v, the index of a node
+    Output:
+       * A generator over the indices of the children of v, from left to right
+    """
+    w = t.first_child[v]
+    while w != -1:
+        yield w
+        w = t.next_sibling[w]
+
+
 def filter(v):
     """
     Input:
-       * v, a secondary structure tree
+       * v, a secondary structure tree, nested or flat
     Output:
        * A boolean if the tree contains no m3o and m5 or not 
     """
-    BP_children = [vv[0] for vv in v[1] if not is_leaf(vv)]
-    BP_leaves = [vv[0] for vv in v[1] if is_leaf(vv)]
-    val = 3
-    val2 = 1
-    if v[0] == "root":
-        val = 4
-        val2 = 2
-    if len(BP_children) > val or (len(BP_leaves) > 0 and len(BP_children) > val2):
-        return False
-    resu = True
-    for vv in v[1]:
-        resu = resu and filter(vv)
-    return resu
+    t = as_flat_tree(v)
+    for w in range(len(t.name)):
+        val = 3
+        val2 = 1
+        if t.kind[w] == ROOT:
+            val = 4
+            val2 = 2
+        if t.nb_helix_children[w] > val or (t.nb_leaf_children[w] > 0 and t.nb_helix_children[w] > val2):
+            return False
+    return True
 
 children_colors_from_parent = {
     'AU' : ['AU','GC','CG'],
@@ -111,99 +235,133 @@ def subset(li1, li2):
 def isProper(v, seq):
     """
     Input:
-        * v, a tree 
+        * v, a tree, nested or flat
         * seq, a sequence 
     Output:
         * A boolean that says if the coloring associated with seq is proper
     """
-    if is_leaf(v):
-        return (seq[v[0][0]] == "A")
-    else:
-        if v[0] == "root":
+    t = as_flat_tree(v)
+    for w in range(len(t.name)):
+        if t.kind[w] == LEAF:
+            if seq[t.name[w][0]] != "A":
+                return False
+            continue
+        if t.kind[w] == ROOT:
             tolerated_colors = children_colors_from_parent['R']
         else:
-            c = seq[v[0][0]] + seq[v[0][1]]
+            c = seq[t.name[w][0]] + seq[t.name[w][1]]
             if c not in ["AU", "UA", "GC", "CG"]:
                 return False
             tolerated_colors = children_colors_from_parent[c]
-        BP_children = [vv[0] for vv in v[1] if not is_leaf(vv)]
-        colors_BP = [seq[name[0]] + seq[name[1]] for name in BP_children]
+        colors_BP = [seq[t.name[ww][0]] + seq[t.name[ww][1]] for ww in flat_children(t, w) if t.kind[ww] != LEAF]
         colors_BP.sort()
         if not subset(colors_BP, tolerated_colors):
             return False
-        else:
-            resu = True
-            for w in children(v):
-                resu = resu and isProper(w, seq)
-            return resu
+    return True
+
+
+def flat_levels(t, seq):
+    """
+    Input:
+        * t, a flat tree
+        * seq, a sequence
+    Output:
+        * The level of each node: 0 for the top of the tree, then increased by the GC and decreased by the CG base pairs on the path from the top
+    """
+    level = [0 for _ in t.name]
+    #Nodes are numbered in preorder, the level of a parent is known before the ones of its children.
+    for w in range(1, len(t.name)):
+        p = t.parent[w]
+        level[w] = level[p]
+        if t.kind[p] == PAIR:
+            c = seq[t.name[p][0]] + seq[t.name[p][1]]
+            if c == "GC":
+                level[w] += 1
+            elif c == "CG":
+                level[w] -= 1
+    return level
 
 
 def isSeparable(t, seq, minmodulo = -1):
     """
     Input:
-        * t, a tree
+        * t, a tree, nested or flat
         * seq, a sequence that corresponds to a proper coloring
     Output:
         * A boolean that says if the coloring associated with seq is separable
           This coloring is supposed to be proper
     """
-    def leaf_to_A(v):
-        if is_leaf(v):
-            if seq[v[0][0]] != "A":
+    t = as_flat_tree(t)
+    for w in range(len(t.name)):
+        if t.kind[w] == LEAF and seq[t.name[w][0]] != "A":
+            if minmodulo == -1:
                 return False
-            else:
-                return True
-        else:
-            resu = True
-            for w in children(v):
-               resu = resu and leaf_to_A(w) 
-            return resu
-    def grey_and_leaf_level(v, current):
-        if is_leaf(v):
-            return [("l", current)]
-        else:
-            resu = []
-            next_level = current
-            if v[0] != "root":
-                c = seq[v[0][0]] + seq[v[0][1]]
-                if c == "AU" or c=="UA":
-                    resu = [("g", current)]
-                elif c == "GC":
-                    next_level = current + 1  
-                elif c == "CG":
-                    next_level = current - 1  
-            for w in children(v):
-               resu = resu + grey_and_leaf_level(w, next_level)    
-            return resu
-    if not leaf_to_A(t):
-        if minmodulo == -1:
-            return False
-        return False, -1
-    li = grey_and_leaf_level(t, 0)
-    LV_grey = [j for (i,j) in li if i == "g"]
-    LV_leaf = [j for (i,j) in li if i == "l"]
-    inter = [j for j in LV_leaf if j in LV_grey]
+            return False, -1
+    level = flat_levels(t, seq)
+    LV_grey = []
+    LV_leaf = []
+    for w in range(len(t.name)):
+        if t.kind[w] == LEAF:
+            LV_leaf.append(level[w])
+        elif t.kind[w] == PAIR and seq[t.name[w][0]] + seq[t.name[w][1]] in ["AU", "UA"]:
+            LV_grey.append(level[w])
+    inter = set(LV_leaf) & set(LV_grey)
     m = -1
     for i in range(2, minmodulo + 1):
-        LV_grey_mod = [j%i for j in LV_grey]
-        LV_leaf_mod = [j%i for j in LV_leaf]
-        inter_mod = [j for j in LV_leaf_mod if j in LV_grey_mod]
-        if (inter_mod == []):
+        LV_grey_mod = {j%i for j in LV_grey}
+        if LV_grey_mod.isdisjoint(j%i for j in LV_leaf):
             m = i
             break
     if minmodulo == -1:
-        return (inter == [])
+        return (len(inter) == 0)
     else:
-        return (inter == []), m
+        return (len(inter) == 0), m
 
 
 def fullSeparable(seq, ss):
-    t = dbn_to_tree(ssparse(ss))
-    if filter(t):
-        if isProper(t, seq):
-            if isSeparable(t, seq):
-                return True
-    return False
+    """
+    Input:
+        * seq, a sequence
+        * ss, a secondary structure as a well-parenthesized string
+    Output:
+        * A boolean that says if the structure passes filter and if the coloring associated with seq is proper and separable.
+          The three criteria are checked together in a single scan of the structure, stopping at the first violation
+    """
+    dbn = ssparse(ss)
+    #For each open node: its assignment, the level of its children, its number of base pair children,
+    #if it has a leaf child and the colors of its base pair children.
+    stack = [["R", 0, 0, False, 0]]
+    LV_grey = set()
+    LV_leaf = set()
+    for i in range(len(dbn)):
+        if dbn[i] != -1 and dbn[i] < i:
+            stack.pop()
+            continue
+        node = stack[-1]
+        #Bounds of filter, the top of the tree tolerating one more base pair child.
+        (val, val2) = (3, 1)
+        if len(stack) == 1:
+            (val, val2) = (4, 2)
+        level = node[1]
+        if dbn[i] == -1:
+            if seq[i] != "A" or node[2] > val2 or level in LV_grey:
+                return False
+            node[3] = True
+            LV_leaf.add(level)
+            continue
+        c = seq[i] + seq[dbn[i]]
+        if c not in COLOR_BITS or c not in children_colors_from_parent[node[0]] or node[4] & COLOR_BITS[c]:
+            return False
+        node[2] += 1
+        node[4] |= COLOR_BITS[c]
+        if node[2] > val or (node[3] and node[2] > val2):
+            return False
+        if c in ["AU", "UA"]:
+            if level in LV_leaf:
+                return False
+            LV_grey.add(level)
+        stack.append([c, level + delta(c), 0, False, 0])
+    return True
 
 def delta(c):
     """
@@ -227,6 +385,27 @@ def delta(c):
 
 
 
+def children_assignments(leaves, c):
+    """
+    Input:
+        * leaves, for each child of a node from left to right, if it is a leaf
+        * c, assignment of the parent base pairs (or information that the parent is the root)
+    Output:
+        * The complete list of an ordered list of assignments for the leaves and BP children, built from the last child
+    """
+    res = [[]]
+    for leaf in reversed(leaves):
+        if leaf:
+            if c not in ["AU","UA"]:
+                res = [['A'] + lp for lp in res if ('AU' not in lp) and ('UA' not in lp)]
+            else:
+                res = []
+        else:
+            res = [[cv] + a for cv in children_colors_from_parent[c] for a in res
+                   if (cv not in a) and ((cv not in ["AU","UA"]) or ('A' not in a))]
+    return res
+
+
 def get_assignments(l,c,i=0):
     """
     Input:
@@ -236,32 +415,156 @@ def get_assignments(l,c,i=0):
     Output:
         * The complete list of an ordered list of assignments for the leaves and BP children
     """
-    if i >= len(l):
-        return [[]]
-    else:
-        v = l[i]
-        if is_leaf(v):
-            if c not in ["AU","UA"]:
-                return [['A'] + lp for lp in get_assignments(l,c,i+1) if ('AU' not in lp) and ('UA' not in lp)]
+    return children_assignments([is_leaf(v) for v in l[i:]], c)
+
+
+#Bits of the colors of the base pair children of a node, to track the colors already used.
+COLOR_BITS = {"AU": 1, "UA": 2, "GC": 4, "CG": 8}
+AU_UA_BITS = 3
+
+
+def children_dp(t, kids, c, next_level_mod, m, leaves_levels_mod, cache):
+    """
+    Input:
+        * t, a flat tree
+        * kids, the children of a node assigned c, from left to right
+        * next_level_mod, the level modulo m of the children
+        * m, leaves_levels_mod, cache, as in num_design, the cache being filled for the children
+    Output:
+        * options, for each child the list of its possible (assignment, number of designs), in the order of get_assignments
+        * suffix, for each i the dictionary giving, for a state (colors used by the children before i, if one of them is a leaf),
+          the sum over the assignments of the children from i of the product of their numbers of designs.
+          Assignments follow get_assignments: distinct colors of base pairs, and no leaf with an AU or UA parent or sibling.
+          A state of the first i children is kept only if it is reachable, the cost is linear in the number of children
+    """
+    options = []
+    for w in kids:
+        if t.kind[w] == LEAF:
+            if c in ["AU","UA"]:
+                options.append([])
             else:
-                return []
-        
+                options.append([('A', cache[(t.name[w], 'A', next_level_mod, m, leaves_levels_mod)])])
         else:
-            res = []
-            for cv in children_colors_from_parent[c]:
-                for a in get_assignments(l,c,i+1):
-                    if cv not in a:
-                        if (cv not in ["AU","UA"]) or ('A' not in a):
-                            res.append([cv] + a)
-            return res
+            options.append([(cv, cache[(t.name[w], cv, next_level_mod, m, leaves_levels_mod)]) for cv in children_colors_from_parent[c]])
+    reachable = [{(0, False)}]
+    for i in range(len(kids)):
+        nexts = set()
+        for (mask, leaf) in reachable[i]:
+            for (cv, _) in options[i]:
+                if cv == 'A':
+                    nexts.add((mask, True))
+                elif not mask & COLOR_BITS[cv]:
+                    nexts.add((mask | COLOR_BITS[cv], leaf))
+        reachable.append(nexts)
+    suffix = [None for _ in range(len(kids) + 1)]
+    suffix[len(kids)] = {(mask, leaf): int(not (leaf and mask & AU_UA_BITS)) for (mask, leaf) in reachable[len(kids)]}
+    for i in reversed(range(len(kids))):
+        suffix[i] = {}
+        for (mask, leaf) in reachable[i]:
+            acc = 0
+            for (cv, nb) in options[i]:
+                if cv == 'A':
+                    acc += nb * suffix[i+1][(mask, True)]
+                elif not mask & COLOR_BITS[cv]:
+                    acc += nb * suffix[i+1][(mask | COLOR_BITS[cv], leaf)]
+            suffix[i][(mask, leaf)] = acc
+    return options, suffix
+
+
+#Key standing for all the sets of leaf levels at once: the counts are then arrays indexed by the bitmask of the set.
+ALL_LEAF_LEVELS = "all"
+
+#For each (m, level), the array telling which sets of leaf levels, as bitmasks, contain level.
+LEAF_LEVEL_INDICATORS = {}
+
+
+def leaf_level_indicator(level_mod, m, leaves_levels_mod):
+    """
+    Input:
+        * level_mod, a level modulo m
+        * m, the modulo considered for m-separability
+        * leaves_levels_mod, the list of levels specific to the nodes, or ALL_LEAF_LEVELS
+    Output:
+        * 1 if level_mod is a level of the leaves and 0 otherwise,
+          with ALL_LEAF_LEVELS an array of these values for each of the 2**m sets of leaf levels
+    """
+    if leaves_levels_mod != ALL_LEAF_LEVELS:
+        return int(level_mod in leaves_levels_mod)
+    if (m, level_mod) not in LEAF_LEVEL_INDICATORS:
+        #Python integers, the number of designs grows too fast for fixed size integers.
+        indicator = np.array([(mask >> level_mod) & 1 for mask in range(2**m)], dtype=object)
+        #Shared by all the caches, it must never be modified in place.
+        indicator.flags.writeable = False
+        LEAF_LEVEL_INDICATORS[(m, level_mod)] = indicator
+    return LEAF_LEVEL_INDICATORS[(m, level_mod)]
+
+
+def fill_num_design(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=None):
+    """
+    Input:
+        * t, a flat tree
+        * c, the assignement for the top of the tree
+        * current_level_mod, m, leaves_levels_mod, cache, GCweight, as in num_design
+    Output:
+        * Fills cache with the number of designs of the subtrees, for the assignments and levels reachable from the top of the tree, from the leaves up
+    """
+    needed = [set() for _ in t.name]
+    needed[0].add((c, current_level_mod))
+    #Nodes are numbered in preorder, the states of a node are known before the ones of its children.
+    for v in range(len(t.name)):
+        for (cv, level_mod) in needed[v]:
+            if (t.name[v], cv, level_mod, m, leaves_levels_mod) in cache or t.kind[v] == LEAF:
+                continue
+            if (cv=="AU" or cv=="UA") and leaves_levels_mod != ALL_LEAF_LEVELS and (level_mod in leaves_levels_mod):
+                continue
+            next_level_mod = (level_mod + delta(cv)) % m
+            for w in flat_children(t, v):
+                if t.kind[w] == LEAF:
+                    if cv not in ["AU","UA"]:
+                        needed[w].add(('A', next_level_mod))
+                else:
+                    for cw in children_colors_from_parent[cv]:
+                        needed[w].add((cw, next_level_mod))
+    for v in reversed(range(len(t.name))):
+        kids = None
+        for (cv, level_mod) in needed[v]:
+            state = (t.name[v], cv, level_mod, m, leaves_levels_mod)
+            if state in cache:
+                continue
+            if t.kind[v] == LEAF:
+                cache[state] = leaf_level_indicator(level_mod, m, leaves_levels_mod)
+            elif (cv=="AU" or cv=="UA") and leaves_levels_mod != ALL_LEAF_LEVELS and (level_mod in leaves_levels_mod):
+                cache[state] = 0
+            else:
+                if kids is None:
+                    kids = list(flat_children(t, v))
+                next_level_mod = (level_mod + delta(cv)) % m
+                #All the leaves are at the same level, they are possible together or not at all.
+                leaf_factor = 1
+                if t.nb_leaf_children[v] > 0:
+                    leaf_factor = int(cv not in ["AU","UA"]) * leaf_level_indicator(next_level_mod, m, leaves_levels_mod)
+                if t.nb_helix_children[v] == 0:
+                    acc = leaf_factor
+                elif t.nb_helix_children[v] == 1:
+                    #A single base pair child takes any tolerated color, except AU and UA next to leaves.
+                    w = next(w for w in kids if t.kind[w] != LEAF)
+                    acc = leaf_factor * sum(cache[(t.name[w], cw, next_level_mod, m, leaves_levels_mod)] for cw in children_colors_from_parent[cv]
+                                            if t.nb_leaf_children[v] == 0 or cw not in ["AU","UA"])
+                else:
+                    (_, suffix) = children_dp(t, kids, cv, next_level_mod, m, leaves_levels_mod, cache)
+                    acc = suffix[0][(0, False)]
+                if (cv=="AU" or cv=="UA") and leaves_levels_mod == ALL_LEAF_LEVELS:
+                    #AU and UA base pairs are forbidden at the levels of the leaves, that is for the subsets containing their level.
+                    acc = acc * (1 - leaf_level_indicator(level_mod, m, leaves_levels_mod))
+                if GCweight is not None and (cv in ["GC", "CG"]):
+                    acc = exp(GCweight) * acc
+                cache[state] = acc
 
 
-    
-    
 def num_design(v, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=None):
     """
     Input:
-        * v, a secondary structure tree
+        * v, a secondary structure tree, nested or flat
         * c, the assignement for node v[0]
         * current_level_mod, the current level modulo m
         * m, the modulo considered for m-separability
@@ -271,67 +574,167 @@ def num_design(v, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=No
     Output:
         * The number of designs for the current tree under these parameters
     """
-    state = (v[0], c, current_level_mod,m,leaves_levels_mod)
+    t = as_flat_tree(v)
+    state = (t.name[0], c, current_level_mod,m,leaves_levels_mod)
     if state not in cache:
-        if is_leaf(v):
-            if current_level_mod in leaves_levels_mod:
-                cache[state] = 1
-            else:
-                cache[state] = 0
-        elif (c=="AU" or c=="UA") and (current_level_mod in leaves_levels_mod):
-            cache[state] = 0
-        else:
-            acc = 0
-            next_level_mod = (current_level_mod + delta(c)) % m
-            for assignment in get_assignments(children(v),c):
-                prod = 1
-                if GCweight is not None and (c in ["GC", "CG"]):
-                    prod = exp(GCweight)
-                for i,w in enumerate(children(v)):
-                    prod *= num_design(w, assignment[i], next_level_mod, m,leaves_levels_mod, cache, GCweight=GCweight)
-                acc += prod
-            cache[state] = acc
+        fill_num_design(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=GCweight)
     return cache[state]
 
 
 def stochastic_backtrack(v, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=None):
     """
     Input:
-        * v, a secondary structure tree
+        * v, a secondary structure tree, nested or flat
         * c, the assignement for node v[0]
         * current_level_mod, the current level modulo m
         * m, the modulo considered for m-separability
         * leaves_levels_mod, the list of levels specific to the nodes
-        * cache, the partial solutions for subtrees
+        * cache, the partial solutions for subtrees, filled by num_design
         * GCweight, optional, the weight to attribute to GC base pairs
     Output:
         * A design uniformly sampled for the current tree under these parameters
     """
-    state = (v[0], c, current_level_mod, m, leaves_levels_mod)
-    if is_leaf(v):
-        return c
-    else:
-        acc = 0
-        next_level_mod = (current_level_mod + delta(c)) % m
-        r = random.random()*cache[state]
-        for assignment in get_assignments(children(v),c):
-            prod = 1
-            if GCweight is not None and (c in ["GC", "CG"]):
-                prod = exp(GCweight)
-            for i,w in enumerate(children(v)):
-                prod *= num_design(w, assignment[i], next_level_mod, m,leaves_levels_mod, cache, GCweight=GCweight)
-            r -= prod
-            if r<0:
-                res = ""
-                for i,w in enumerate(children(v)):
-                    loc = stochastic_backtrack(w, assignment[i], next_level_mod, m,leaves_levels_mod, cache, GCweight=GCweight)
-                    if loc is None:
-                        return None
-                    res += loc
-                if c == "R":
-                    return res
+    t = as_flat_tree(v)
+    num_design(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=GCweight)
+    #Positions are relative to the first one of the tree.
+    (start, size) = flat_span(t)
+    res = ['' for _ in range(size)]
+    #Nodes are visited in preorder, so that random numbers are drawn in the same order as a recursive backtrack.
+    stack = [(0, c, current_level_mod)]
+    while stack != []:
+        (w, cw, level_mod) = stack.pop()
+        if t.kind[w] == LEAF:
+            res[t.name[w][0] - start] = cw
+            continue
+        if t.kind[w] == PAIR:
+            res[t.name[w][0] - start] = cw[0]
+            res[t.name[w][1] - start] = cw[1]
+        kids = list(flat_children(t, w))
+        next_level_mod = (level_mod + delta(cw)) % m
+        (options, suffix) = children_dp(t, kids, cw, next_level_mod, m, leaves_levels_mod, cache)
+        r = random.random()*cache[(t.name[w], cw, level_mod, m, leaves_levels_mod)]
+        prod = 1
+        if GCweight is not None and (cw in ["GC", "CG"]):
+            prod = exp(GCweight)
+        #The assignment is drawn child by child, in the order of get_assignments, each choice weighted by all its completions.
+        chosen = []
+        (mask, leaf) = (0, False)
+        for i in range(len(kids)):
+            found = False
+            for (cv, nb) in options[i]:
+                if cv == 'A':
+                    next_state = (mask, True)
+                elif not mask & COLOR_BITS[cv]:
+                    next_state = (mask | COLOR_BITS[cv], leaf)
                 else:
-                    return c[0]+res+c[1]
+                    continue
+                weight = prod * nb * suffix[i+1][next_state]
+                if r - weight < 0:
+                    chosen.append(cv)
+                    prod *= nb
+                    (mask, leaf) = next_state
+                    found = True
+                    break
+                r -= weight
+            if not found:
+                return None
+        for i in reversed(range(len(kids))):
+            stack.append((kids[i], chosen[i], next_level_mod))
+    return "".join(res)
+
+
+def sampling_table(t, v, c, level_mod, m, leaves_levels_mod, cache):
+    """
+    Input:
+        * t, a flat tree
+        * v, a node of t that is not a leaf
+        * c, the assignment of v
+        * level_mod, m, leaves_levels_mod, cache, as in num_design, the cache being filled for the children of v
+    Output:
+        * The children of v, their level modulo m and, for each child i and each state reachable before it (as in children_dp),
+          the list of its possible (assignment, number of designs, next state) with the cumulative array of their weights.
+          The table is kept in the cache, under a key that can not be the one of a number of designs.
+    """
+    key = ("sampling", t.name[v], c, level_mod, m, leaves_levels_mod)
+    if key not in cache:
+        kids = list(flat_children(t, v))
+        next_level_mod = (level_mod + delta(c)) % m
+        (options, suffix) = children_dp(t, kids, c, next_level_mod, m, leaves_levels_mod, cache)
+        steps = []
+        for i in range(len(kids)):
+            steps.append({})
+            for (mask, leaf) in suffix[i]:
+                choices = []
+                cumulative = []
+                acc = 0
+                for (cv, nb) in options[i]:
+                    if cv == 'A':
+                        next_state = (mask, True)
+                    elif not mask & COLOR_BITS[cv]:
+                        next_state = (mask | COLOR_BITS[cv], leaf)
+                    else:
+                        continue
+                    weight = nb * suffix[i+1][next_state]
+                    if weight > 0:
+                        acc += weight
+                        choices.append((cv, nb, next_state))
+                        cumulative.append(acc)
+                steps[i][(mask, leaf)] = (choices, cumulative)
+        cache[key] = (kids, next_level_mod, steps)
+    return cache[key]
+
+
+def sample_designs(v, k, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=None):
+    """
+    Input:
+        * v, a secondary structure tree, nested or flat
+        * k, the number of designs to sample
+        * c, current_level_mod, m, leaves_levels_mod, GCweight, as in stochastic_backtrack
+        * cache, the partial solutions for subtrees, filled by num_design if needed, and kept for later calls with the same parameters
+    Output:
+        * A list of k independent designs for the current tree under these parameters,
+          sampled uniformly, or proportionally to exp(GCweight) to the power of their number of GC and CG base pairs.
+          Empty if the tree has no design.
+    """
+    if leaves_levels_mod == ALL_LEAF_LEVELS:
+        raise ValueError("The designs are sampled for a single set of leaf levels")
+    t = as_flat_tree(v)
+    if num_design(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=GCweight) == 0:
+        return []
+    (start, size) = flat_span(t)
+    designs = []
+    for _ in range(k):
+        res = ['' for _ in range(size)]
+        stack = [(0, c, current_level_mod)]
+        while stack != []:
+            (w, cw, level_mod) = stack.pop()
+            if t.kind[w] == LEAF:
+                res[t.name[w][0] - start] = cw
+                continue
+            if t.kind[w] == PAIR:
+                res[t.name[w][0] - start] = cw[0]
+                res[t.name[w][1] - start] = cw[1]
+            (kids, next_level_mod, steps) = sampling_table(t, w, cw, level_mod, m, leaves_levels_mod, cache)
+            if kids == []:
+                continue
+            #The factor of GCweight is common to all the assignments of the children, one number is drawn for the whole node.
+            r = random.random() * steps[0][(0, False)][1][-1]
+            state = (0, False)
+            chosen = []
+            for i in range(len(kids)):
+                (choices, cumulative) = steps[i][state]
+                #Rounding may bring r to the total weight, the last choice is then taken.
+                j = min(bisect_right(cumulative, r), len(choices) - 1)
+                if j > 0:
+                    r -= cumulative[j-1]
+                (cv, nb, state) = choices[j]
+                #The remaining number is uniform among the completions of the choice made.
+                r = r / nb
+                chosen.append(cv)
+            for i in reversed(range(len(kids))):
+                stack.append((kids[i], chosen[i], next_level_mod))
+        designs.append("".join(res))
+    return designs
 
 
 def part(i):
@@ -349,11 +752,61 @@ def part(i):
 
 
 
-def first_modulo_separable(t, modulolimit=4):
+def leaf_levels_from_mask(mask, m):
+    """
+    Input:
+        * mask, a set of levels modulo m as a bitmask
+        * m, the modulo considered for m-separability
+    Output:
+        * The tuple of the levels of mask, in increasing order as in part
+    """
+    return tuple(level for level in range(m) if (mask >> level) & 1)
+
+
+def separable_leaf_levels(t, modulolimit=4, GCweight=None):
+    """
+    Input:
+        * t, a secondary structure tree, nested or flat
+        * modulolimit, the largest modulo tried
+        * GCweight, optional, the weight to attribute to GC base pairs
+    Output:
+        * The first (m, leaves_levels_mod) with at least one design, in the order of first_modulo_separable, None if there is none
+        * A dictionary giving, for each m tried, the array of the number of designs of each set of leaf levels, indexed by its bitmask.
+          All the sets of leaf levels of a modulo are counted together, in a single pass over the tree.
+    """
+    t = as_flat_tree(t)
+    counts = {}
     for m in range(2, modulolimit + 1):
-        for leaf_level in part(m - 1):
-            cache = {}
-            if num_design(t, "R", 0, m, tuple(leaf_level), cache, GCweight=None) > 0:
-                seq = stochastic_backtrack(t, "R", 0, m, tuple(leaf_level), cache)
-                return seq
-            
\ No newline at end of file
+        counts[m] = num_design(t, "R", 0, m, ALL_LEAF_LEVELS, {}, GCweight=GCweight)
+        #The bitmasks are increasing in the order of part(m - 1).
+        for mask in range(2**m):
+            if counts[m][mask] > 0:
+                return (m, leaf_levels_from_mask(mask, m)), counts
+    return None, counts
+
+
+def first_modulo_separable(t, modulolimit=4):
+    t = as_flat_tree(t)
+    (found, _) = separable_leaf_levels(t, modulolimit)
+    if found is not None:
+        (m, leaf_level) = found
+        return stochastic_backtrack(t, "R", 0, m, leaf_level, {})
+            
+
+
+def modulo_separable_designs(t, k, modulolimit=4, GCweight=None):
+    """
+    Input:
+        * t, a secondary structure tree, nested or flat
+        * k, the number of designs to sample
+        * modulolimit, the largest modulo tried
+        * GCweight, optional, the weight to attribute to GC base pairs
+    Output:
+        * k designs sampled with sample_designs for the first (m, leaves_levels_mod) of first_modulo_separable, empty if there is none
+    """
+    t = as_flat_tree(t)
+    (found, _) = separable_leaf_levels(t, modulolimit, GCweight=GCweight)
+    if found is None:
+        return []
+    (m, leaf_level) = found
+    return sample_designs(t, k, "R", 0, m, leaf_level, {}, GCweight=GCweight)
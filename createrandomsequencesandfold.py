@@ -1,15 +1,248 @@
 # positioningempiricalmaxstacksdesigns
 # Copyright (C) 2026 THEO BOURY 
 
-from checkSeparability import fullSeparable, dbn_to_tree, filter, ssparse, first_modulo_separable
+from checkSeparability import fullSeparable, dbn_to_flat_tree, ssparse, separable_leaf_levels, sample_designs
 from FoldingTurner import fold_turner
-from foldingStacking import delta_main_stacking2 
+from foldingStacking import main_stacking_only_one
 from foldingBP import main_unitary_only_one
-from SecondaryStructureGeneration import ssrandom #ssrandom(n,count,count_stacked,theta,min_helix)
+from SecondaryStructureGeneration import ssrandom_filtered
 from RandomCompatible import choose_random_seq
+from ResultsStatistics import aggregate, count
+from ResultsStore import load_store, load_column
 import csv
+import json
+import multiprocessing
+import os
+import random
 
 
+#Number of structures without any separable design rejected in a row before the modulo of the Separable experiment is increased.
+SEPARABLE_REJECTIONS = 1000
+
+
+#Suffix of the CSV files of the experiments run with the lazy Turner folding, so that their rows are never mixed with
+#the ones of the full folding (their Turner folds are the MFE structure of RNAfold when it is not the target).
+LAZY_TURNER_SUFFIX = "_lazyturner"
+
+
+def results_name(name, lazy_turner=False):
+    """
+    Input:
+        * name, the CSV file of an experiment
+        * lazy_turner, if the Turner folding is lazy
+    Output:
+        * The CSV file of the experiment, with LAZY_TURNER_SUFFIX before its extension for the lazy Turner folding
+    """
+    if lazy_turner:
+        return name[:-len(".csv")] + LAZY_TURNER_SUFFIX + ".csv"
+    return name
+
+
+def lazy_target(ss, lazy_turner):
+    """
+    Input:
+        * ss, the target structure of an iteration
+        * lazy_turner, if the Turner folding is lazy
+    Output:
+        * The target to give to fold_turner: ss for the lazy folding, which enumerates the co-optimal structures
+          only when the MFE structure is ss, None for the full folding
+    """
+    if lazy_turner:
+        return ss
+    return None
+
+
+#Count tables of ssrandom_filtered, shared by all the iterations run by the current process.
+COUNT_TABLES = {}
+
+
+def count_tables(theta, min_helix):
+    """
+    Input:
+        * theta, the minimal number of unpaired positions between the extremities of a base pair
+        * min_helix, minimal size allowed for the helices
+    Output:
+        * The dictionary of count tables of ssrandom_filtered for these parameters, shared by the iterations of the current process
+    """
+    if (theta, min_helix) not in COUNT_TABLES:
+        COUNT_TABLES[(theta, min_helix)] = {}
+    return COUNT_TABLES[(theta, min_helix)]
+
+
+def run_one_iteration(task):
+    """
+    Input:
+        * task, a tuple (iteration_function, i, args, seed)
+    Output:
+        * The row computed by iteration_function(i, *args). If seed is not None, the random generator
+          is first seeded from (iteration_function, seed, i) so that the iteration does not depend on the ones run before it,
+          nor on the iterations of other experiments run with the same seed (as the refinement of an experiment)
+    """
+    (iteration_function, i, args, seed) = task
+    if seed is not None:
+        random.seed("%s-%d-%d" % (iteration_function.__name__, seed, i))
+    return iteration_function(i, *args)
+
+
+def run_iterations(iteration_function, jobs, workers=1, seed=None):
+    """
+    Input:
+        * iteration_function, a function computing one row of results from an index i and some arguments
+        * jobs, a list of (i, args) 
+        * workers, the number of processes to use
+        * seed, the base seed of the per-iteration random generators, None to keep the global random state.
+          It is required with several workers, which would otherwise all draw from the same random state
+          (open_results draws and journals one when none is given)
+    Output:
+        * A generator over the rows of the jobs, in the order of jobs. With a seed, rows do not depend on workers
+    """
+    if workers > 1 and seed is None:
+        raise ValueError("A base seed is required to run the iterations on several workers")
+    tasks = [(iteration_function, i, args, seed) for (i, args) in jobs]
+    if workers <= 1:
+        for task in tasks:
+            yield run_one_iteration(task)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            for resu in pool.imap(run_one_iteration, tasks):
+                yield resu
+
+
+def journal_name(name):
+    """
+    Input:
+        * name, the CSV file of an experiment
+    Output:
+        * The file journaling the iterations written to it
+    """
+    return name + ".journal"
+
+
+def last_journal_record(name):
+    """
+    Input:
+        * name, the CSV file of an experiment
+    Output:
+        * The record of the last iteration journaled for it, None if there is none.
+          A record cut by a crash while it was written is ignored, its iteration is computed again
+    """
+    record = None
+    if os.path.exists(journal_name(name)):
+        with open(journal_name(name), 'r') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+    return record
+
+
+def journal_last_index(name):
+    """
+    Input:
+        * name, the CSV file of an experiment
+    Output:
+        * The index of the last iteration journaled for it, -1 if there is none
+    """
+    record = last_journal_record(name)
+    if record is None:
+        return -1
+    return record["index"]
+
+
+def resume_point(name, resume):
+    """
+    Input:
+        * name, the CSV file of an experiment
+        * resume, True to continue the iterations journaled for it
+    Output:
+        * The (restart, last_index) of the experiment: continue after the last journaled iteration if there is one,
+          start again otherwise
+    """
+    if resume:
+        last_index = journal_last_index(name)
+        if last_index != -1:
+            print("resuming", name, "after iteration", last_index)
+            return 0, last_index
+    return 1, -1
+
+
+def open_results(name, header, restart, workers=1, seed=None):
+    """
+    Input:
+        * name, the CSV file of an experiment
+        * header, its first row
+        * restart, 1 to start the file again, 0 to append to it after the last iteration journaled
+        * workers, seed, as in run_iterations
+    Output:
+        * The CSV file, its writer, the journal and the base seed to use. When appending, the rows written after the last
+          journaled iteration are removed, and the base seed (or the random state without seed) of the journal is restored.
+          A seed, or several workers for a journal without seed, that would not continue the journaled iterations raise ValueError
+    """
+    if restart:
+        csvfile = open(name, 'w', newline='')
+        journal = open(journal_name(name), 'w')
+    else:
+        record = last_journal_record(name)
+        if record is not None:
+            #A resumed file must give the same rows as an uninterrupted run, it can not mix two random streams.
+            if seed is not None and seed != record["seed"]:
+                raise ValueError("The seed " + str(seed) + " is not the base seed " + str(record["seed"]) + " journaled for " + name + ", resume without seed or with the same one")
+            if record["seed"] is None and workers > 1:
+                raise ValueError(name + " was run without base seed, it can only be resumed with one worker")
+            os.truncate(name, record["offset"])
+            seed = record["seed"]
+            if record["rng"] is not None:
+                random.setstate((record["rng"][0], tuple(record["rng"][1]), record["rng"][2]))
+        csvfile = open(name, 'a', newline='')
+        journal = open(journal_name(name), 'a')
+    #The base seed required by several workers is drawn here, to be journaled.
+    if workers > 1 and seed is None:
+        seed = random.randrange(2**32)
+        print("base seed", seed)
+    writer = csv.writer(csvfile, delimiter=' ',
+                        quotechar='|', quoting=csv.QUOTE_MINIMAL)
+    if restart:
+        writer.writerow(header)
+    return csvfile, writer, journal, seed
+
+
+def journal_row(csvfile, journal, i, seed):
+    """
+    Input:
+        * csvfile, a CSV file of results, the row of iteration i being written to it
+        * journal, its journal
+        * i, the index of the iteration
+        * seed, the base seed of the iterations
+    Output:
+        * Journals iteration i once its row is on disk, with the size of the CSV file after it and, without seed,
+          the random state from which the next iterations are drawn
+    """
+    csvfile.flush()
+    os.fsync(csvfile.fileno())
+    rng = None
+    if seed is None:
+        rng = random.getstate()
+    journal.write(json.dumps({"index": i, "offset": csvfile.tell(), "seed": seed, "rng": rng}) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def write_results(name, header, iteration_function, jobs, restart=1, workers=1, seed=None):
+    """
+    Input:
+        * name, the CSV file of an experiment
+        * header, its first row
+        * iteration_function, jobs, workers, seed, as in run_iterations
+        * restart, as in open_results
+    Output:
+        * Writes the row of each job to name, each iteration being journaled as soon as its row is written
+    """
+    (csvfile, writer, journal, seed) = open_results(name, header, restart, workers=workers, seed=seed)
+    with csvfile, journal:
+        for (i, _), resu in zip(jobs, run_iterations(iteration_function, jobs, workers=workers, seed=seed)):
+            writer.writerow(resu)
+            journal_row(csvfile, journal, i, seed)
 
 
 def sstopairs(ss):
@@ -36,265 +269,214 @@ def pairstoss(n, li):
 
     return "".join(resu)
 
-def create_stats_from_Stacking_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1):
-    c = 'a'
-    if restart:
-        c = 'w'
-    with open('ResultsfromStacking.csv', c, newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=' ',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        if restart:
-            elem = ["ss", "seq", "Separable(Aonly)", "BPDesign", "BPfold", "TurnerDesign", "Turnerfold"]
-            writer.writerow(elem)
-        count,count_stacked = {}, {}
-        for i in range(last_index+1, iteration):
-            resu = []
-            ss = ssrandom(n,count,count_stacked,theta,min_helix)
-            t = dbn_to_tree(ssparse(ss))
-            while not filter(t):
-                ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                t = dbn_to_tree(ssparse(ss))
-            print("iteration", i, " ss", ss)
+def iteration_from_Stacking_A_only_nom3o_nom5(i, n, theta, min_helix, lazy_turner=False):
+    tables = count_tables(theta, min_helix)
+    resu = []
+    ss = ssrandom_filtered(n,tables,theta,min_helix)
+    t = dbn_to_flat_tree(ssparse(ss))
+    print("iteration", i, " ss", ss)
+    seq = choose_random_seq(t, withA=True)
+    timeout = 0
+    Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+    Slist0struct = pairstoss(n, Slist0)
+    while ((nbS != 1) or  (Slist0struct != ss)):
+        seq = choose_random_seq(t, withA=True)
+        Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+
+        if timeout >= 1000:
+            ss = ssrandom_filtered(n,tables,theta,min_helix)
+            t = dbn_to_flat_tree(ssparse(ss))
+            print("iteration", i, " again, ss", ss)
             seq = choose_random_seq(t, withA=True)
             timeout = 0
-            Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-            Slist0struct = pairstoss(n, Slist[0])
-            while ((len(Slist) != 1) or  (Slist0struct != ss)):
-                seq = choose_random_seq(t, withA=True)
-                Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-                
-                if timeout >= 1000:
-                    ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                    t = dbn_to_tree(ssparse(ss))
-                    while not filter(t):
-                        ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                        t = dbn_to_tree(ssparse(ss))
-                    print("iteration", i, " again, ss", ss)
-                    seq = choose_random_seq(t, withA=True)
-                    timeout = 0
-                else:
-                    timeout+=1
-                Slist0struct = pairstoss(n, Slist[0])
-            resu.append(ss)
-            resu.append(seq)
-            Separable = "False"
-            if fullSeparable(seq, ss):
-                Separable = "True"
-            resu.append(Separable)
-            BPstruct0, nb  = main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov")
-            BPDesign= "False"
-            BPstruct = pairstoss(n, BPstruct0)
-            if nb == 1 and BPstruct == ss:
-                BPDesign = "True"
-            resu.append(BPDesign)
-            resu.append(BPstruct)
-            Turnerss, nb2 = fold_turner(seq)
-            TurnerDesign = "False"
-            if nb2 == 1 and Turnerss == ss:
-                TurnerDesign = "True"
-            resu.append(TurnerDesign)
-            resu.append(Turnerss)
-
-            writer.writerow(resu)
+        else:
+            timeout+=1
+        Slist0struct = pairstoss(n, Slist0)
+    resu.append(ss)
+    resu.append(seq)
+    Separable = "False"
+    if fullSeparable(seq, ss):
+        Separable = "True"
+    resu.append(Separable)
+    BPstruct0, nb  = main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+    BPDesign= "False"
+    BPstruct = pairstoss(n, BPstruct0)
+    if nb == 1 and BPstruct == ss:
+        BPDesign = "True"
+    resu.append(BPDesign)
+    resu.append(BPstruct)
+    Turnerss, nb2 = fold_turner(seq, target=lazy_target(ss, lazy_turner))
+    TurnerDesign = "False"
+    if nb2 == 1 and Turnerss == ss:
+        TurnerDesign = "True"
+    resu.append(TurnerDesign)
+    resu.append(Turnerss)
+    return resu
+
+
+def create_stats_from_Stacking_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1, workers=1, seed=None, lazy_turner=False):
+    elem = ["ss", "seq", "Separable(Aonly)", "BPDesign", "BPfold", "TurnerDesign", "Turnerfold"]
+    jobs = [(i, (n, theta, min_helix, lazy_turner)) for i in range(last_index+1, iteration)]
+    write_results(results_name('ResultsfromStacking.csv', lazy_turner), elem, iteration_from_Stacking_A_only_nom3o_nom5, jobs, restart=restart, workers=workers, seed=seed)
 
 
 def from_stacking_read_stats_from_csv(name):
-    isTurnernotBP = 0
-    isTurnerandBP = 0
-    isBPnotTurner = 0
-    isnotBPnotTurner = 0
-
-    isTurnernotSeparable=0
-    isTurnerandSeparable=0
-    isSeparablenotTurner=0
-    isnotSeparablenotTurner=0
-    with open(name, 'r') as csvfile:
-        for line in csvfile.readlines()[1:]:
-            _, _, Separable, BPDesign, _, TurnerDesign, _ = line.split(' ')
-            if TurnerDesign == "True" and BPDesign == "False":
-                isTurnernotBP+=1
-            if TurnerDesign == "True" and BPDesign == "True":
-                isTurnerandBP+=1
-            if TurnerDesign == "False" and BPDesign == "True":
-                isBPnotTurner+=1
-            if TurnerDesign == "False" and BPDesign == "False":
-                isnotBPnotTurner+=1
-
-            if TurnerDesign == "True" and Separable == "False":
-                isTurnernotSeparable+=1
-            if TurnerDesign == "True" and Separable == "True":
-                isTurnerandSeparable+=1
-            if TurnerDesign == "False" and Separable == "True":
-                isSeparablenotTurner+=1
-            if TurnerDesign == "False" and Separable == "False":
-                isnotSeparablenotTurner+=1
+    stats = aggregate(name, tables=[("TurnerDesign", "BPDesign"), ("TurnerDesign", "Separable(Aonly)")])
+    isTurnernotBP = count(stats, ("TurnerDesign", "BPDesign"), ("True", "False"))
+    isTurnerandBP = count(stats, ("TurnerDesign", "BPDesign"), ("True", "True"))
+    isBPnotTurner = count(stats, ("TurnerDesign", "BPDesign"), ("False", "True"))
+    isnotBPnotTurner = count(stats, ("TurnerDesign", "BPDesign"), ("False", "False"))
+
+    isTurnernotSeparable = count(stats, ("TurnerDesign", "Separable(Aonly)"), ("True", "False"))
+    isTurnerandSeparable = count(stats, ("TurnerDesign", "Separable(Aonly)"), ("True", "True"))
+    isSeparablenotTurner = count(stats, ("TurnerDesign", "Separable(Aonly)"), ("False", "True"))
+    isnotSeparablenotTurner = count(stats, ("TurnerDesign", "Separable(Aonly)"), ("False", "False"))
     print("isTurnernotBP:", isTurnernotBP," isTurnerandBP:", isTurnerandBP, " isBPnotTurner:", isBPnotTurner, "isnotBPnotTurner:", isnotBPnotTurner, "\n")
     print("isTurnernotSeparable:", isTurnernotSeparable," isTurnerandSeparable:", isTurnerandSeparable, " isSeparablenotTurner:", isSeparablenotTurner, "isnotSeparablenotTurner:", isnotSeparablenotTurner, "\n")
 
 
-def create_stats_from_Separable_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1):
-    c = 'a'
-    if restart:
-        c = 'w'
-    with open('ResultsfromSeparable.csv', c, newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=' ',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        if restart:
-            elem = ["ss", "seq", "StackingDesign","StackingFold", "TurnerDesign", "Turnerfold"]
-            writer.writerow(elem)
-        count,count_stacked = {}, {}
-
-
-
-        for i in range(last_index+1, iteration):
-            resu = []
-            ss = ssrandom(n,count,count_stacked,theta,min_helix)
-            t = dbn_to_tree(ssparse(ss))
-            while not filter(t):
-                ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                t = dbn_to_tree(ssparse(ss))
-            print("iteration", i, " ss", ss)
-            seq = None
-            while seq is None:
-                seq = first_modulo_separable(t, modulolimit=2)
-            resu.append(ss)
-            resu.append(seq)
-            Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-            StackDesign="False"
-            Stackstruct = pairstoss(n, Slist[0])
-            if len(Slist) == 1 and Stackstruct == ss:
-                StackDesign="True"
-            resu.append(StackDesign)
-            resu.append(Stackstruct)
-            Turnerss, nb2 = fold_turner(seq)
-            TurnerDesign = "False"
-            if nb2 == 1 and Turnerss == ss:
-                TurnerDesign = "True"
-            resu.append(TurnerDesign)
-            resu.append(Turnerss)
-            writer.writerow(resu)
-
+def iteration_from_Separable_A_only_nom3o_nom5(i, n, theta, min_helix, lazy_turner=False):
+    tables = count_tables(theta, min_helix)
+    resu = []
+    ss = ssrandom_filtered(n,tables,theta,min_helix)
+    t = dbn_to_flat_tree(ssparse(ss))
+    print("iteration", i, " ss", ss)
+    modulolimit = 2
+    rejected = 0
+    #No design for any set of leaf levels proves that the structure has no separable design up to modulolimit.
+    (found, _) = separable_leaf_levels(t, modulolimit)
+    while found is None:
+        rejected += 1
+        if rejected % SEPARABLE_REJECTIONS == 0:
+            modulolimit += 1
+            print("iteration", i, " modulo increased to", modulolimit)
+        ss = ssrandom_filtered(n,tables,theta,min_helix)
+        t = dbn_to_flat_tree(ssparse(ss))
+        print("iteration", i, " no separable design, again, ss", ss)
+        (found, _) = separable_leaf_levels(t, modulolimit)
+    if rejected > 0:
+        print("iteration", i, " rejected", rejected, "structures without separable design")
+    (m, leaf_level) = found
+    seq = sample_designs(t, 1, "R", 0, m, leaf_level, {})[0]
+    resu.append(ss)
+    resu.append(seq)
+    Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+    StackDesign="False"
+    Stackstruct = pairstoss(n, Slist0)
+    if nbS == 1 and Stackstruct == ss:
+        StackDesign="True"
+    resu.append(StackDesign)
+    resu.append(Stackstruct)
+    Turnerss, nb2 = fold_turner(seq, target=lazy_target(ss, lazy_turner))
+    TurnerDesign = "False"
+    if nb2 == 1 and Turnerss == ss:
+        TurnerDesign = "True"
+    resu.append(TurnerDesign)
+    resu.append(Turnerss)
+    #The modulo may have been increased for this structure, the rows keep the parameters their design was sampled with.
+    resu.append(m)
+    resu.append(sum(1 << level for level in leaf_level))
+    return resu
+
+
+def create_stats_from_Separable_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1, workers=1, seed=None, lazy_turner=False):
+    #leaf_levels is the bitmask of the levels of the leaves modulo m, as in separable_leaf_levels.
+    elem = ["ss", "seq", "StackingDesign","StackingFold", "TurnerDesign", "Turnerfold", "modulo", "leaf_levels"]
+    jobs = [(i, (n, theta, min_helix, lazy_turner)) for i in range(last_index+1, iteration)]
+    write_results(results_name('ResultsfromSeparable.csv', lazy_turner), elem, iteration_from_Separable_A_only_nom3o_nom5, jobs, restart=restart, workers=workers, seed=seed)
 
 
 def from_separable_read_stats_from_csv(name):
-    isTurnernotStacking = 0
-    isTurnerandStacking = 0
-    isStackingnotTurner = 0
-    isnotStackingnotTurner = 0
-    with open(name, 'r') as csvfile:
-        for line in csvfile.readlines()[1:]:
-            _, _, StackDesign, _, TurnerDesign, _ = line.split(' ')
-            if TurnerDesign == "True" and StackDesign == "False":
-                isTurnernotStacking+=1
-            if TurnerDesign == "True" and StackDesign == "True":
-                isTurnerandStacking+=1
-            if TurnerDesign == "False" and StackDesign == "True":
-                isStackingnotTurner+=1
-            if TurnerDesign == "False" and StackDesign == "False":
-                isnotStackingnotTurner+=1
+    stats = aggregate(name, tables=[("TurnerDesign", "StackingDesign"), ("modulo",)])
+    isTurnernotStacking = count(stats, ("TurnerDesign", "StackingDesign"), ("True", "False"))
+    isTurnerandStacking = count(stats, ("TurnerDesign", "StackingDesign"), ("True", "True"))
+    isStackingnotTurner = count(stats, ("TurnerDesign", "StackingDesign"), ("False", "True"))
+    isnotStackingnotTurner = count(stats, ("TurnerDesign", "StackingDesign"), ("False", "False"))
     print("isTurnernotStacking:", isTurnernotStacking," isTurnerandStacking:", isTurnerandStacking, " isStackingnotTurner:", isStackingnotTurner, "isnotStackingnotTurner:", isnotStackingnotTurner, "\n")
-
-def create_stats_from_Stacking_A_only_withm3o_withm5(n, iteration,theta,min_helix, restart=1,last_index=-1):
-    c = 'a'
-    if restart:
-        c = 'w'
-    with open('ResultsfromStackingwithm3oandm5.csv', c, newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=' ',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        if restart:
-            elem = ["ss", "seq", "TurnerDesign", "Turnerfold"]
-            writer.writerow(elem)
-        count,count_stacked = {}, {}
-        for i in range(last_index+1, iteration):
-            resu = []
-            ss = ssrandom(n,count,count_stacked,theta,min_helix)
-            t = dbn_to_tree(ssparse(ss))
-            while filter(t):
-                ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                t = dbn_to_tree(ssparse(ss))
-            print("iteration", i, " ss", ss)
+    print("designs by modulo:", dict(sorted((int(m), nb) for ((m,), nb) in stats["tables"][("modulo",)].items())), "\n")
+
+def iteration_from_Stacking_A_only_withm3o_withm5(i, n, theta, min_helix, lazy_turner=False):
+    tables = count_tables(theta, min_helix)
+    resu = []
+    ss = ssrandom_filtered(n,tables,theta,min_helix, large_loop=True)
+    t = dbn_to_flat_tree(ssparse(ss))
+    print("iteration", i, " ss", ss)
+    seq = choose_random_seq(t, withA=True)
+    timeout = 0
+    Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+    Slist0struct = pairstoss(n, Slist0)
+    while ((nbS != 1) or  (Slist0struct != ss)):
+        seq = choose_random_seq(t, withA=True)
+        Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+
+        if timeout >= 1000:
+            ss = ssrandom_filtered(n,tables,theta,min_helix, large_loop=True)
+            t = dbn_to_flat_tree(ssparse(ss))
+            print("iteration", i, " again, ss", ss)
             seq = choose_random_seq(t, withA=True)
             timeout = 0
-            Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-            Slist0struct = pairstoss(n, Slist[0])
-            while ((len(Slist) != 1) or  (Slist0struct != ss)):
-                seq = choose_random_seq(t, withA=True)
-                Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-                
-                if timeout >= 1000:
-                    ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                    t = dbn_to_tree(ssparse(ss))
-                    while filter(t):
-                        ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                        t = dbn_to_tree(ssparse(ss))
-                    print("iteration", i, " again, ss", ss)
-                    seq = choose_random_seq(t, withA=True)
-                    timeout = 0
-                else:
-                    timeout+=1
-                Slist0struct = pairstoss(n, Slist[0])
-            resu.append(ss)
-            resu.append(seq)
-            Turnerss, nb2 = fold_turner(seq)
-            TurnerDesign = "False"
-            if nb2 == 1 and Turnerss == ss:
-                TurnerDesign = "True"
-            resu.append(TurnerDesign)
-            resu.append(Turnerss)
-
-            writer.writerow(resu)
+        else:
+            timeout+=1
+        Slist0struct = pairstoss(n, Slist0)
+    resu.append(ss)
+    resu.append(seq)
+    Turnerss, nb2 = fold_turner(seq, target=lazy_target(ss, lazy_turner))
+    TurnerDesign = "False"
+    if nb2 == 1 and Turnerss == ss:
+        TurnerDesign = "True"
+    resu.append(TurnerDesign)
+    resu.append(Turnerss)
+    return resu
+
+
+def create_stats_from_Stacking_A_only_withm3o_withm5(n, iteration,theta,min_helix, restart=1,last_index=-1, workers=1, seed=None, lazy_turner=False):
+    elem = ["ss", "seq", "TurnerDesign", "Turnerfold"]
+    jobs = [(i, (n, theta, min_helix, lazy_turner)) for i in range(last_index+1, iteration)]
+    write_results(results_name('ResultsfromStackingwithm3oandm5.csv', lazy_turner), elem, iteration_from_Stacking_A_only_withm3o_withm5, jobs, restart=restart, workers=workers, seed=seed)
 
 
 def from_stacking_withm3om5_read_stats_from_csv(name):
-    isTurner = 0
-    with open(name, 'r') as csvfile:
-        for line in csvfile.readlines()[1:]:
-            _, _, TurnerDesign, _ = line.split(' ')
-            if TurnerDesign == "True":
-                isTurner+=1
+    stats = aggregate(name, tables=[("TurnerDesign",)])
+    isTurner = count(stats, ("TurnerDesign",), ("True",))
     print("isTurner:", isTurner, "\n")
 
 
-def refine_stats_from_Stacking_A_only_withm3o_withm5():
-    with open('ResultsfromStackingwithm3oandm5increased.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=' ', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        elem = ["ss", "seq", "TurnerDesign", "Turnerfold", "random_compatible_seq", "random_compatible_TurnerDesign", "random_compatible_Turnerfold"]
-        writer.writerow(elem)
-        i = -1
-        with open('ResultsfromStackingwithm3oandm5.csv', 'r') as readfile:
-            for line in readfile.readlines()[1:]:
-                i+=1
-                ss, seq, TurnerDesign, Turnerfold = line.strip().split(' ')
-                print("iteration", i, " ss", ss)
-                resu = [ss, seq, TurnerDesign, Turnerfold]
-                t = dbn_to_tree(ssparse(ss))
-                random_compatible_seq = choose_random_seq(t, withA=True)
-                random_compatible_Turnerfold, nb2 = fold_turner(random_compatible_seq)
-                random_compatible_TurnerDesign = "False"
-                if nb2 == 1 and random_compatible_Turnerfold == ss:
-                    random_compatible_TurnerDesign = "True"
-                resu.append(random_compatible_seq)
-                resu.append(random_compatible_TurnerDesign)
-                resu.append(random_compatible_Turnerfold)
-                print(resu, "\n")
-                writer.writerow(resu)
+def iteration_refine_from_Stacking_A_only_withm3o_withm5(i, ss, seq, TurnerDesign, Turnerfold, lazy_turner=False):
+    print("iteration", i, " ss", ss)
+    resu = [ss, seq, TurnerDesign, Turnerfold]
+    t = dbn_to_flat_tree(ssparse(ss))
+    random_compatible_seq = choose_random_seq(t, withA=True)
+    random_compatible_Turnerfold, nb2 = fold_turner(random_compatible_seq, target=lazy_target(ss, lazy_turner))
+    random_compatible_TurnerDesign = "False"
+    if nb2 == 1 and random_compatible_Turnerfold == ss:
+        random_compatible_TurnerDesign = "True"
+    resu.append(random_compatible_seq)
+    resu.append(random_compatible_TurnerDesign)
+    resu.append(random_compatible_Turnerfold)
+    print(resu, "\n")
+    return resu
+
+
+def refine_stats_from_Stacking_A_only_withm3o_withm5(restart=1, last_index=-1, workers=1, seed=None, store=None, lazy_turner=False):
+    elem = ["ss", "seq", "TurnerDesign", "Turnerfold", "random_compatible_seq", "random_compatible_TurnerDesign", "random_compatible_Turnerfold"]
+    if store is None:
+        with open(results_name('ResultsfromStackingwithm3oandm5.csv', lazy_turner), 'r') as readfile:
+            jobs = [(i, line.strip().split(' ') + [lazy_turner]) for i, line in enumerate(readfile.readlines()[1:]) if i > last_index]
+    else:
+        #The rows are loaded column by column from the store of 'ResultsfromStackingwithm3oandm5.csv'.
+        results = load_store(store)
+        columns = [load_column(results, column) for column in ["ss", "seq", "TurnerDesign", "Turnerfold"]]
+        jobs = [(i, [ss, seq, str(TurnerDesign), Turnerfold, lazy_turner]) for i, (ss, seq, TurnerDesign, Turnerfold) in enumerate(zip(*columns)) if i > last_index]
+    write_results(results_name('ResultsfromStackingwithm3oandm5increased.csv', lazy_turner), elem, iteration_refine_from_Stacking_A_only_withm3o_withm5, jobs, restart=restart, workers=workers, seed=seed)
+
 
 def from_stacking_withm3om5increased_read_stats_from_csv(name):
-    isTurnerandrandom_compatible_TurnerDesign = 0
-    isTurnernotrandom_compatible_TurnerDesign = 0
-    israndom_compatible_TurnerDesignnotTurner = 0
-    isnotrandom_compatible_TurnerDesignnotTurner = 0
-    with open(name, 'r') as csvfile:
-        for line in csvfile.readlines()[1:]:
-            _, _, TurnerDesign, _, _, random_compatible_TurnerDesign, _ = line.split(' ')
-            if TurnerDesign == "True" and random_compatible_TurnerDesign == "True":
-                isTurnerandrandom_compatible_TurnerDesign+=1
-            if TurnerDesign == "True" and random_compatible_TurnerDesign == "False":
-                isTurnernotrandom_compatible_TurnerDesign+=1
-            if TurnerDesign == "False" and random_compatible_TurnerDesign == "True":
-                israndom_compatible_TurnerDesignnotTurner+=1
-            if TurnerDesign == "False" and random_compatible_TurnerDesign == "False":
-                isnotrandom_compatible_TurnerDesignnotTurner+=1
+    table = ("TurnerDesign", "random_compatible_TurnerDesign")
+    stats = aggregate(name, tables=[table])
+    isTurnerandrandom_compatible_TurnerDesign = count(stats, table, ("True", "True"))
+    isTurnernotrandom_compatible_TurnerDesign = count(stats, table, ("True", "False"))
+    israndom_compatible_TurnerDesignnotTurner = count(stats, table, ("False", "True"))
+    isnotrandom_compatible_TurnerDesignnotTurner = count(stats, table, ("False", "False"))
     print("isTurnerandrandom_compatible_TurnerDesign:", isTurnerandrandom_compatible_TurnerDesign, "\n",
           "isTurnernotrandom_compatible_TurnerDesign",isTurnernotrandom_compatible_TurnerDesign, "\n",
           "israndom_compatible_TurnerDesignnotTurner", israndom_compatible_TurnerDesignnotTurner, "\n",
@@ -303,101 +485,71 @@ def from_stacking_withm3om5increased_read_stats_from_csv(name):
 
 
 
-def stacking_vs_BP_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1):
-    c = 'a'
-    if restart:
-        c = 'w'
-    with open('ResultsStackingvsBP.csv', c, newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=' ',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        if restart:
-            elem = ["ss", "Stacking_seq", "Stacking_TurnerFold", "Stacking_TurnerDesign", "BP_seq", "BP_TurnerFold", "BP_TurnerDesign", "nb_it_more_for_finding_BP"]
-            writer.writerow(elem)
-        count,count_stacked = {}, {}
-        for i in range(last_index+1, iteration):
-            resu = []
-            ss = ssrandom(n,count,count_stacked,theta,min_helix)
-            t = dbn_to_tree(ssparse(ss))
-            while not filter(t):
-                ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                t = dbn_to_tree(ssparse(ss))
-            print("iteration", i, " ss", ss)
+def iteration_stacking_vs_BP_A_only_nom3o_nom5(i, n, theta, min_helix, lazy_turner=False):
+    tables = count_tables(theta, min_helix)
+    resu = []
+    ss = ssrandom_filtered(n,tables,theta,min_helix)
+    t = dbn_to_flat_tree(ssparse(ss))
+    print("iteration", i, " ss", ss)
+    timeout = 0
+    BPDesign= False
+    StackingDesign= False
+    while (not BPDesign) or (not StackingDesign):
+        seq = choose_random_seq(t, withA=True)
+        if not StackingDesign:
+            Slist0, nbS  = main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+            Slist0struct = pairstoss(n, Slist0)
+            if (nbS == 1) and (Slist0struct == ss):
+                StackingDesign = True
+                Stacking_seq = seq
+                it_stack=timeout
+        if not BPDesign:
+            BPstruct, nb  = main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="numpy")
+            BPstruct = pairstoss(n, BPstruct)
+            if nb == 1 and BPstruct == ss:
+                BPDesign = True
+                BP_seq = seq
+                it_BP=timeout
+        if timeout >= 10000:
+            print("nb", nb)
+            print("BPDesign", BPDesign,  "StackingDesign", StackingDesign)
+            ss = ssrandom_filtered(n,tables,theta,min_helix)
+            t = dbn_to_flat_tree(ssparse(ss))
+            print("iteration", i, " again, ss", ss)
             timeout = 0
-            BPDesign= False
-            StackingDesign= False
-            while (not BPDesign) or (not StackingDesign):
-                seq = choose_random_seq(t, withA=True)
-                if not StackingDesign:
-                    Slist  = delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = None, name_file = "", show=False)
-                    Slist0struct = pairstoss(n, Slist[0])
-                    if (len(Slist) == 1) and (Slist0struct == ss):
-                        StackingDesign = True
-                        Stacking_seq = seq
-                        it_stack=timeout
-                if not BPDesign:
-                    BPstruct, nb  = main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov")
-                    BPstruct = pairstoss(n, BPstruct)
-                    if nb == 1 and BPstruct == ss:
-                        BPDesign = True
-                        BP_seq = seq
-                        it_BP=timeout
-                if timeout >= 10000:
-                    print("nb", nb)
-                    print("BPDesign", BPDesign,  "StackingDesign", StackingDesign)
-                    ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                    t = dbn_to_tree(ssparse(ss))
-                    while not filter(t):
-                        ss = ssrandom(n,count,count_stacked,theta,min_helix)
-                        t = dbn_to_tree(ssparse(ss))
-                    print("iteration", i, " again, ss", ss)
-                    timeout = 0
-                else:
-                    timeout+=1
-
-
-
-            Stacking_TurnerFold, nbStack = fold_turner(Stacking_seq)
-            BP_TurnerFold, nbBP = fold_turner(BP_seq)
-            Stacking_TurnerDesign = "False"
-            BP_TurnerDesign = "False"
-            if nbStack == 1 and Stacking_TurnerFold == ss:
-                Stacking_TurnerDesign = "True"
-            if nbBP == 1 and BP_TurnerFold == ss:
-                BP_TurnerDesign = "True"
-            nb_it_more_for_finding_BP = it_BP - it_stack
-            resu = [ss, Stacking_seq, Stacking_TurnerFold, Stacking_TurnerDesign, BP_seq, BP_TurnerFold, BP_TurnerDesign, nb_it_more_for_finding_BP]
-            writer.writerow(resu)
+        else:
+            timeout+=1
 
 
-def stacking_vs_BP_read_stats_from_csv(name):
-    isStacking_TurnerDesignandBP_TurnerDesign = 0
-    isStacking_TurnerDesignnotBP_TurnerDesign = 0
-    isBP_TurnerDesignnotStacking_TurnerDesign = 0
-    isnotBP_TurnerDesignnotStacking_TurnerDesign = 0
-
-
-    with open(name, 'r') as csvfile:
-        res_it = 0
-        num = 0
-        for line in csvfile.readlines()[1:]:
-            num+=1
-            _, _, _, Stacking_TurnerDesign, _, _, BP_TurnerDesign, nb_it_more_for_finding_BP = line.strip().split(' ')
-            res_it+= float(nb_it_more_for_finding_BP)
-            if Stacking_TurnerDesign == "True" and BP_TurnerDesign == "True":
-                isStacking_TurnerDesignandBP_TurnerDesign+=1
-            if Stacking_TurnerDesign == "True" and BP_TurnerDesign == "False":
-                isStacking_TurnerDesignnotBP_TurnerDesign+=1
-            if Stacking_TurnerDesign == "False" and BP_TurnerDesign == "True":
-                isBP_TurnerDesignnotStacking_TurnerDesign+=1
-            if Stacking_TurnerDesign == "False" and BP_TurnerDesign == "False":
-                isnotBP_TurnerDesignnotStacking_TurnerDesign+=1
-    print("isStacking_TurnerDesignandBP_TurnerDesign:", isStacking_TurnerDesignandBP_TurnerDesign, "\n",
-    "isStacking_TurnerDesignnotBP_TurnerDesign:", isStacking_TurnerDesignnotBP_TurnerDesign, "\n",
-    "isBP_TurnerDesignnotStacking_TurnerDesign:", isBP_TurnerDesignnotStacking_TurnerDesign, "\n",
-    "isnotBP_TurnerDesignnotStacking_TurnerDesign:", isnotBP_TurnerDesignnotStacking_TurnerDesign, "\n",
-    "In mean, nb of additional iteration necessary to get a design in BP (not taking restart into account)", res_it/num)
 
+    Stacking_TurnerFold, nbStack = fold_turner(Stacking_seq, target=lazy_target(ss, lazy_turner))
+    BP_TurnerFold, nbBP = fold_turner(BP_seq, target=lazy_target(ss, lazy_turner))
+    Stacking_TurnerDesign = "False"
+    BP_TurnerDesign = "False"
+    if nbStack == 1 and Stacking_TurnerFold == ss:
+        Stacking_TurnerDesign = "True"
+    if nbBP == 1 and BP_TurnerFold == ss:
+        BP_TurnerDesign = "True"
+    nb_it_more_for_finding_BP = it_BP - it_stack
+    resu = [ss, Stacking_seq, Stacking_TurnerFold, Stacking_TurnerDesign, BP_seq, BP_TurnerFold, BP_TurnerDesign, nb_it_more_for_finding_BP]
+    return resu
 
 
+def stacking_vs_BP_A_only_nom3o_nom5(n, iteration,theta,min_helix, restart=1,last_index=-1, workers=1, seed=None, lazy_turner=False):
+    elem = ["ss", "Stacking_seq", "Stacking_TurnerFold", "Stacking_TurnerDesign", "BP_seq", "BP_TurnerFold", "BP_TurnerDesign", "nb_it_more_for_finding_BP"]
+    jobs = [(i, (n, theta, min_helix, lazy_turner)) for i in range(last_index+1, iteration)]
+    write_results(results_name('ResultsStackingvsBP.csv', lazy_turner), elem, iteration_stacking_vs_BP_A_only_nom3o_nom5, jobs, restart=restart, workers=workers, seed=seed)
 
 
+def stacking_vs_BP_read_stats_from_csv(name):
+    table = ("Stacking_TurnerDesign", "BP_TurnerDesign")
+    stats = aggregate(name, tables=[table], means=["nb_it_more_for_finding_BP"])
+    isStacking_TurnerDesignandBP_TurnerDesign = count(stats, table, ("True", "True"))
+    isStacking_TurnerDesignnotBP_TurnerDesign = count(stats, table, ("True", "False"))
+    isBP_TurnerDesignnotStacking_TurnerDesign = count(stats, table, ("False", "True"))
+    isnotBP_TurnerDesignnotStacking_TurnerDesign = count(stats, table, ("False", "False"))
+    print("isStacking_TurnerDesignandBP_TurnerDesign:", isStacking_TurnerDesignandBP_TurnerDesign, "\n",
+    "isStacking_TurnerDesignnotBP_TurnerDesign:", isStacking_TurnerDesignnotBP_TurnerDesign, "\n",
+    "isBP_TurnerDesignnotStacking_TurnerDesign:", isBP_TurnerDesignnotStacking_TurnerDesign, "\n",
+    "isnotBP_TurnerDesignnotStacking_TurnerDesign:", isnotBP_TurnerDesignnotStacking_TurnerDesign, "\n",
+    "In mean, nb of additional iteration necessary to get a design in BP (not taking restart into account)", stats["means"]["nb_it_more_for_finding_BP"])
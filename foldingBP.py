@@ -6,6 +6,8 @@
 #Considered BPs can contain G-U/U-G or not.
 #For now, theta (min between two extremities of BP) = 0 and is not reported in the function.
 
+import numpy as np
+from foldingCompatibility import allowed_pairs, compatibility, compatibility_array
 
 def isValid(seq, i, j, BPconsidered="Nussinov"):
     """
@@ -16,13 +18,7 @@ def isValid(seq, i, j, BPconsidered="Nussinov"):
     Output: 
         * If the BP (i, j) is feasible over seq or not from the "letters" constraints
     """
-    if BPconsidered == "Nussinov":
-        S = [("A", "U"), ("U", "A"), ("G", "C"), ("C", "G"), ("G", "U"), ("U", "G")]
-    elif BPconsidered == "Watson":
-        S = [("A", "U"), ("U", "A"), ("G", "C"), ("C", "G")]
-    else:
-        raise ValueError("Not a valid model for BPs")
-    return ((seq[i], seq[j]) in S)
+    return ((seq[i], seq[j]) in allowed_pairs(BPconsidered))
 
 
 def Energy(seq, i, j, model="Unitary", BPconsidered="Nussinov"):
@@ -54,19 +50,25 @@ def FillMatUnitary(seq, model="Unitary", BPconsidered="Nussinov"):
     n = len(seq)
     M = [[0 for i in range(n)] for j in range(n)]
     N = [[1 for i in range(n)] for j in range(n)]       
+    _, partners = compatibility(seq, BPconsidered)
     for i in range(n - 1,-1, -1):
+        #Energies of all "pairs" (i, k), computed once per row.
+        energies = [Energy(seq, i, k, model=model, BPconsidered=BPconsidered) for k in range(n)]
         for j in range(i + 1, n):
             
             #i + 1 base is unpaired
             case_unpaired = M[i + 1][j] 
             
             #(i,j) is a "pair". No need to distinguish cases depending if the pair is valid or not, not the case with stackings
-            case_embrace = M[i + 1][j - 1] + Energy(seq, i, j, model="Unitary", BPconsidered="Nussinov") 
+            case_embrace = M[i + 1][j - 1] + energies[j] 
             
-            #(i,k) forms a "pair" (valid or not) that splits in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j).
+            #(i,k) forms a valid pair that splits in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j).
+            #An invalid "pair" never does better than leaving i unpaired, so only valid pairs are considered for the minimum.
             case_split = min(case_unpaired, case_embrace) 
-            for k in range(i + 1, j):
-                case_split = min(case_split, M[i + 1][k - 1] + M[k + 1][j] + Energy(seq, i, k))
+            for k in partners[i]:
+                if k >= j:
+                    break
+                case_split = min(case_split, M[i + 1][k - 1] + M[k + 1][j] + energies[k])
             M[i][j] = case_split
 
             N[i][j] = 0
@@ -75,11 +77,110 @@ def FillMatUnitary(seq, model="Unitary", BPconsidered="Nussinov"):
             if M[i][j] == case_embrace:
                 N[i][j] += N[i + 1][j - 1] 
             for k in range(i + 1, j):
-                if M[i][j] == M[i + 1][k - 1] + M[k + 1][j] + Energy(seq, i, k):
+                if M[i][j] == M[i + 1][k - 1] + M[k + 1][j] + energies[k]:
                    N[i][j] += N[i + 1][k - 1] + N[k + 1][j]
     return M, N[0][n - 1]
+
+
+def FillMatUnitaryNumpy(seq, model="Unitary", BPconsidered="Nussinov"):
+    """
+    Input: 
+        * A sequence seq of nucleotides {A, U, C, G} of size n
+        * An energy model to work with
+        * A model of BP considered BPconsidered
+    Output: 
+        * The same table and number of optimal structures as FillMatUnitary, M and N being filled together row by row with numpy vector operations
+    """
+    n = len(seq)
+    #Tables are padded so that M[k + 1] and N[i + 1][k - 1] always exist.
+    M = np.zeros((n + 2, n + 2), dtype=np.int64)
+    N = np.ones((n + 2, n + 2), dtype=np.int64)
+    #A cell of N sums at most 2n + 2 cells of the previous rows, beyond this bound we switch to python integers to stay exact.
+    limit = 2**63 // (2 * n + 4)
+    #Larger than any reachable energy, marks the splits that do not exist.
+    big = n + 1
+    cols = np.arange(n)
+    valid, _ = compatibility(seq, BPconsidered)
+    for i in range(n - 2, -1, -1):
+        #Unitary model, each valid BP contributes -1.
+        energies = -np.array(valid[i], dtype=np.int64)
+        K = np.arange(i + 1, n)
+
+        #i + 1 base is unpaired
+        case_unpaired = M[i + 1, :n]
+
+        #(i,j) is a "pair"
+        case_embrace = np.full(n, big, dtype=np.int64)
+        case_embrace[i + 1:] = M[i + 1, i:n - 1] + energies[i + 1:]
+
+        #(i,k) forms a "pair" that splits in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j), for all k and j at once.
+        splits = (M[i + 1, K - 1] + energies[K])[:, None] + M[K + 1, :n]
+        splits[cols[None, :] <= K[:, None]] = big
+        best = np.minimum(np.minimum(case_unpaired, case_embrace), splits.min(axis=0))
+
+        ties = splits == best[None, :]
+        count = np.where(case_unpaired == best, N[i + 1, :n], 0) + np.where(case_embrace == best, N[i + 1, cols - 1], 0)
+        count = count + (ties * N[i + 1, K - 1][:, None]).sum(axis=0) + (ties * N[K + 1, :n]).sum(axis=0)
+
+        M[i, i + 1:n] = best[i + 1:]
+        N[i, i + 1:n] = count[i + 1:]
+        if N.dtype != object and count.max() >= limit:
+            N = N.astype(object)
+    return M[:n, :n].tolist(), int(N[0][n - 1])
      
 
+def FillMatUnitaryBatch(seqs, model="Unitary", BPconsidered="Nussinov"):
+    """
+    Input: 
+        * A list seqs of K sequences of nucleotides {A, U, C, G}, all of size n
+        * An energy model to work with
+        * A model of BP considered BPconsidered
+    Output: 
+        * The tables M of FillMatUnitary for all sequences at once, as a numpy array of shape (K, n, n)
+        * The list of the K numbers of optimal structures of FillMatUnitary
+    """
+    K = len(seqs)
+    n = len(seqs[0]) if K > 0 else 0
+    if any(len(seq) != n for seq in seqs):
+        raise ValueError("All sequences of a batch must have the same size")
+    #Unitary model, each valid BP contributes -1.
+    energies = -compatibility_array(seqs, BPconsidered).astype(np.int64)
+    M = np.zeros((K, n + 2, n + 2), dtype=np.int64)
+    N = np.ones((K, n + 2, n + 2), dtype=np.int64)
+    #A cell of N sums at most 2n + 2 cells of the previous rows. The counts of a sequence going beyond this bound are capped
+    #in the batch and computed again with python integers at the end, so that one degenerate sequence does not slow down the others.
+    limit = 2**63 // (2 * n + 4)
+    overflow = np.zeros(K, dtype=bool)
+    #Larger than any reachable energy, marks the splits that do not exist.
+    big = n + 1
+    cols = np.arange(n)
+    for i in range(n - 2, -1, -1):
+        Ks = np.arange(i + 1, n)
+
+        #i + 1 base is unpaired
+        case_unpaired = M[:, i + 1, :n]
+
+        #(i,j) is a "pair"
+        case_embrace = np.full((K, n), big, dtype=np.int64)
+        case_embrace[:, i + 1:] = M[:, i + 1, i:n - 1] + energies[:, i, i + 1:]
+
+        #(i,k) forms a "pair" that splits in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j), for all sequences, k and j at once.
+        splits = np.where(cols[None, None, :] > Ks[None, :, None], (M[:, i + 1, Ks - 1] + energies[:, i, Ks])[:, :, None] + M[:, Ks + 1, :n], big)
+        best = np.minimum(np.minimum(case_unpaired, case_embrace), splits.min(axis=1, initial=big))
+
+        ties = splits == best[:, None, :]
+        count = np.where(case_unpaired == best, N[:, i + 1, :n], 0) + np.where(case_embrace == best, N[:, i + 1, cols - 1], 0)
+        count = count + (ties * N[:, i + 1, Ks - 1][:, :, None]).sum(axis=1) + (ties * N[:, Ks + 1, :n]).sum(axis=1)
+
+        M[:, i, i + 1:n] = best[:, i + 1:]
+        overflow |= count.max(axis=1, initial=0) >= limit
+        N[:, i, i + 1:n] = np.minimum(count[:, i + 1:], limit)
+    nbs = [int(N[s, 0, n - 1]) for s in range(K)]
+    for s in np.flatnonzero(overflow):
+        nbs[s] = FillMatUnitaryNumpy(seqs[s], model=model, BPconsidered=BPconsidered)[1]
+    return M[:, :n, :n], nbs
+
+
 def DeltaBackTrackUnitary(sigma, Slist, delta, M, seq, model="Unitary", BPconsidered="Nussinov"):
     """
     Input: 
@@ -115,9 +216,11 @@ def DeltaBackTrackUnitary(sigma, Slist, delta, M, seq, model="Unitary", BPconsid
         resu += DeltaBackTrackUnitary(newsigma, newSlist, delta - delt, M, seq, model=model, BPconsidered=BPconsidered)
     
 
-    for k in range(i + 1, j):
+    for k in compatibility(seq, BPconsidered)[1][i]:
+        if k >= j:
+            break
         delt= M[i + 1][k -1] + M[k + 1][j] + Energy(seq, i, k, model=model, BPconsidered=BPconsidered) - M[i][j]
-        if delta - delt>= 0 and isValid(seq, i, k, BPconsidered=BPconsidered):
+        if delta - delt>= 0:
             newsigma = [(i + 1, k - 1), (k + 1, j)] + sigma
             newSlist = [(i, k)] + Slist
             resu += DeltaBackTrackUnitary(newsigma, newSlist, delta - delt, M, seq, model=model, BPconsidered=BPconsidered)
@@ -140,27 +243,53 @@ def OptimalBackTrackUnitary(i, j, M, seq, model="Unitary", BPconsidered="Nussino
         if isValid(seq, i, j, BPconsidered=BPconsidered):
             addon = [(i, j)]
         return addon + OptimalBackTrackUnitary(i + 1, j - 1, M, seq, model=model, BPconsidered=BPconsidered)
-    for k in range(i + 1, j):
+    #Reaching this point, leaving i unpaired is not optimal, hence neither is an invalid "pair" (i, k).
+    for k in compatibility(seq, BPconsidered)[1][i]:
+        if k >= j:
+            break
         if M[i][j] == M[i + 1][k -1] + M[k + 1][j] + Energy(seq, i, k, model=model, BPconsidered=BPconsidered):
-            addon = []
-            if isValid(seq, i, k, BPconsidered=BPconsidered):
-                addon = [(i, k)]
+            addon = [(i, k)]
             addon += OptimalBackTrackUnitary(i + 1, k - 1, M, seq, model=model, BPconsidered=BPconsidered)
             addon += OptimalBackTrackUnitary(k + 1, j, M, seq, model=model, BPconsidered=BPconsidered)
             return addon
         
 
-def main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov"):
+def main_unitary_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="python"):
     """
     Input: 
         * A Sequence seq of letters in {A, U, C, G} of size n
         * A energy model to work with
         * A model of BP considered BPconsidered
         * delta, max distance from the optimal allowed
+        * engine, "python" or "numpy", the implementation used to fill the dynamic programming table
     Output: 
         * One structure that maximize the number of base pairs and if there are multiple structures
     """
-    M, nb = FillMatUnitary(seq, model=model, BPconsidered=BPconsidered)
+    if engine == "numpy":
+        M, nb = FillMatUnitaryNumpy(seq, model=model, BPconsidered=BPconsidered)
+    elif engine == "python":
+        M, nb = FillMatUnitary(seq, model=model, BPconsidered=BPconsidered)
+    else:
+        raise ValueError("Not a valid engine for filling the table")
     S = OptimalBackTrackUnitary(0, len(seq) - 1, M, seq, model=model, BPconsidered=BPconsidered)
     return S, nb
 
+
+def batch_main_unitary_only_one(seqs, model="Unitary", BPconsidered="Nussinov"):
+    """
+    Input: 
+        * A list seqs of K sequences of letters in {A, U, C, G}, all of size n
+        * A energy model to work with
+        * A model of BP considered BPconsidered
+    Output: 
+        * For each sequence, the same (structure, number of optimal structures) as main_unitary_only_one, the table being filled for all sequences at once
+    """
+    if len(seqs) == 0:
+        return []
+    M, nbs = FillMatUnitaryBatch(seqs, model=model, BPconsidered=BPconsidered)
+    resu = []
+    for s, seq in enumerate(seqs):
+        S = OptimalBackTrackUnitary(0, len(seq) - 1, M[s].tolist(), seq, model=model, BPconsidered=BPconsidered)
+        resu.append((S, nbs[s]))
+    return resu
+
@@ -0,0 +1,63 @@
+# positioningempiricalmaxstacksdesigns
+# Copyright (C) 2026 THEO BOURY 
+
+#This file contains the pairing constraints shared by all folding algorithms.
+#A sequence is encoded once into a compatibility matrix and lists of valid partners,
+#so that the dynamic programmings and backtracks only iterate over BPs that can form.
+
+from functools import lru_cache
+import numpy as np
+
+LETTERS = "ACGU"
+
+BP_SETS = {
+    "Nussinov": frozenset([("A", "U"), ("U", "A"), ("G", "C"), ("C", "G"), ("G", "U"), ("U", "G")]),
+    "Watson": frozenset([("A", "U"), ("U", "A"), ("G", "C"), ("C", "G")])
+}
+
+
+def allowed_pairs(BPconsidered="Nussinov"):
+    """
+    Input:
+        * A model of BP considered BPconsidered
+    Output:
+        * The set of pairs of letters that can form a BP in this model
+    """
+    if BPconsidered not in BP_SETS:
+        raise ValueError("Not a valid model for BPs")
+    return BP_SETS[BPconsidered]
+
+
+@lru_cache(maxsize=64)
+def compatibility(seq, BPconsidered="Nussinov"):
+    """
+    Input:
+        * A Sequence seq of letters in {A, U, C, G} of size n
+        * A model of BP considered BPconsidered
+    Output:
+        * valid, a n x n matrix (tuple of tuples) such that valid[i][j] says if the BP (i, j) is feasible over seq
+        * partners, partners[i] is the increasing tuple of all k > i such that (i, k) is feasible over seq
+    """
+    S = allowed_pairs(BPconsidered)
+    n = len(seq)
+    #Rows only depend on the letter at position i, they are computed once per letter and shared.
+    rows = {}
+    for a in set(seq):
+        rows[a] = tuple((a, b) in S for b in seq)
+    valid = tuple(rows[a] for a in seq)
+    partners = tuple(tuple(k for k in range(i + 1, n) if valid[i][k]) for i in range(n))
+    return valid, partners
+
+
+def compatibility_array(seqs, BPconsidered="Nussinov"):
+    """
+    Input:
+        * A list seqs of K sequences of letters in {A, U, C, G}, all of size n
+        * A model of BP considered BPconsidered
+    Output:
+        * A boolean numpy array valid of shape (K, n, n) such that valid[s, i, j] says if the BP (i, j) is feasible over seqs[s]
+    """
+    S = allowed_pairs(BPconsidered)
+    table = np.array([[(a, b) in S for b in LETTERS] for a in LETTERS], dtype=bool)
+    codes = np.array([[LETTERS.index(a) for a in seq] for seq in seqs], dtype=np.int64).reshape(len(seqs), -1)
+    return table[codes[:, :, None], codes[:, None, :]]
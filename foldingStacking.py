@@ -11,19 +11,15 @@
 #A Varna interface is used to draw an optimal sequence and structure.
 
 import math
+import numpy as np
+from foldingCompatibility import allowed_pairs, compatibility, compatibility_array
         
 def isValid(seq, i, j, BPconsidered="Nussinov"):
     """Input: - A Sequence seq of letters in {A, U, C, G} of size n
               - A BP (i, j) with i < n and j < n
               - A model of BP considered BPconsidered
        Output: If the BP (i, j) is feasible over seq or not from the "letters" constraints"""
-    if BPconsidered == "Nussinov":
-        S = [("A", "U"), ("U", "A"), ("G", "C"), ("C", "G"), ("G", "U"), ("U", "G")]
-    elif BPconsidered == "Watson":
-        S = [("A", "U"), ("U", "A"), ("G", "C"), ("C", "G")]
-    else:
-        raise ValueError("Not a valid model for BPs")
-    return ((seq[i], seq[j]) in S)
+    return ((seq[i], seq[j]) in allowed_pairs(BPconsidered))
 
 
 def Energy(seq, i, j, model="Unitary", BPconsidered="Nussinov"):
@@ -39,11 +35,12 @@ def Energy(seq, i, j, model="Unitary", BPconsidered="Nussinov"):
     #Add models if wanted
 
 
-def FillMatStacking2(seq, BPconsidered="Nussinov"):
+def FillMatStacking2(seq, BPconsidered="Nussinov", count=False):
     """Input: - A sequence seq of nucleotides {A, U, C, G} of size n
               - A energy model to work with
               - A model of BP considered BPconsidered
-       Output: The dynamic programming tables for folding over seq in a stacking model"""
+              - count, if set the number of optimal structures is also computed
+       Output: The dynamic programming tables for folding over seq in a stacking model, followed by the tables NE and NS of numbers of optimal structures if count is set"""
     #No need to specify the model here, we need "unitary" contirbutions for each BP "stacked".
     n = len(seq)
     
@@ -53,6 +50,11 @@ def FillMatStacking2(seq, BPconsidered="Nussinov"):
     #S[i][j] is optimal energy for all structures possible between i and j such that (i - 1,j + 1) is a valid BP. 
     S = [[0 for i in range(n)] for j in range(n)]
 
+    #NE[i][j] (resp. NS[i][j]) is the number of structures between i and j reaching E[i][j] (resp. S[i][j]).
+    NE = [[1 for i in range(n)] for j in range(n)]
+    NS = [[1 for i in range(n)] for j in range(n)]
+
+    valid, partners = compatibility(seq, BPconsidered)
             
     for i in range(n - 1,-1, -1):
         for j in range(i + 1, n):
@@ -63,20 +65,161 @@ def FillMatStacking2(seq, BPconsidered="Nussinov"):
             #if i != 0 and j !=n - 1:
             case_embraceS=math.inf
             case_embraceE=math.inf
-            if isValid(seq, i, j, BPconsidered=BPconsidered):
+            if valid[i][j]:
                 case_embraceS = S[i +1][j - 1] + Energy(seq, i, j, BPconsidered=BPconsidered) 
                 case_embraceE = S[i +1][j - 1]
         
             #(i,k) forms a valid "pair" that split in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j).
             case_split = case_unpaired
-            for k in range(i + 1, j):
-                if isValid(seq, i, k, BPconsidered=BPconsidered):
-                    case_split = min(case_split, S[i + 1][k - 1] + E[k + 1][j])
+            for k in partners[i]:
+                if k >= j:
+                    break
+                case_split = min(case_split, S[i + 1][k - 1] + E[k + 1][j])
             E[i][j] = min(case_split, case_embraceE)
             S[i][j] = min(case_split, case_embraceS)
+
+            if count:
+                #Same cases as above, each one reaching the optimal value adds its number of structures.
+                NE[i][j] = 0
+                NS[i][j] = 0
+                if case_unpaired == E[i][j]:
+                    NE[i][j] += NE[i + 1][j]
+                if case_unpaired == S[i][j]:
+                    NS[i][j] += NE[i + 1][j]
+                if case_embraceE == E[i][j]:
+                    NE[i][j] += NS[i + 1][j - 1]
+                if case_embraceS == S[i][j]:
+                    NS[i][j] += NS[i + 1][j - 1]
+                for k in partners[i]:
+                    if k >= j:
+                        break
+                    case_k = S[i + 1][k - 1] + E[k + 1][j]
+                    if case_k == E[i][j]:
+                        NE[i][j] += NS[i + 1][k - 1] * NE[k + 1][j]
+                    if case_k == S[i][j]:
+                        NS[i][j] += NS[i + 1][k - 1] * NE[k + 1][j]
+    if count:
+        return E, S, NE, NS
     return E, S
 
 
+def FillMatStackingNumpy(seq, BPconsidered="Nussinov", count=False):
+    """Input: - A sequence seq of nucleotides {A, U, C, G} of size n
+              - A model of BP considered BPconsidered
+              - count, if set the number of optimal structures is also computed
+       Output: The same dynamic programming tables as FillMatStacking2, each row being filled with numpy vector operations"""
+    n = len(seq)
+    
+    #Tables are padded with one extra row and column so that E[k + 1] and S[i + 1] always exist.
+    E = np.zeros((n + 1, n + 1), dtype=np.int64)
+    S = np.zeros((n + 1, n + 1), dtype=np.int64)
+    NE = np.ones((n + 1, n + 1), dtype=np.int64)
+    NS = np.ones((n + 1, n + 1), dtype=np.int64)
+    #A cell of NE or NS sums at most n + 2 products of two cells, beyond this bound we switch to python integers to stay exact.
+    limit = math.isqrt(2**63 // (n + 2))
+    #Larger than any reachable energy, plays the role of math.inf for forbidden splits.
+    big = n + 1
+    cols = np.arange(n)
+    _, partners = compatibility(seq, BPconsidered)
+
+    for i in range(n - 2, -1, -1):
+        K = np.array(partners[i], dtype=np.int64)
+        
+        #i base is unpaired
+        case_unpaired = E[i + 1, :n]
+        
+        #(i,k) forms a valid "pair" that split in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j), for all k and j at once.
+        splits = S[i + 1, K - 1][:, None] + E[K + 1, :n]
+        splits[cols[None, :] <= K[:, None]] = big
+        case_split = np.minimum(case_unpaired, splits.min(axis=0, initial=big))
+        
+        #(i, j) placed over (i+1, j-1), only the last BP of a helix does not contribute.
+        case_embraceE = np.full(n, big, dtype=np.int64)
+        case_embraceE[K] = S[i + 1, K - 1]
+        case_embraceS = case_embraceE - 1
+        Erow = np.minimum(case_split, case_embraceE)
+        Srow = np.minimum(case_split, case_embraceS)
+        E[i, i + 1:n] = Erow[i + 1:]
+        S[i, i + 1:n] = Srow[i + 1:]
+
+        if count:
+            #Same cases as above, each one reaching the optimal value adds its number of structures.
+            nb_splits = NS[i + 1, K - 1][:, None] * NE[K + 1, :n]
+            nb_embrace = NS[i + 1, cols - 1]
+            NErow = np.where(case_unpaired == Erow, NE[i + 1, :n], 0) + np.where(case_embraceE == Erow, nb_embrace, 0) + ((splits == Erow[None, :]) * nb_splits).sum(axis=0)
+            NSrow = np.where(case_unpaired == Srow, NE[i + 1, :n], 0) + np.where(case_embraceS == Srow, nb_embrace, 0) + ((splits == Srow[None, :]) * nb_splits).sum(axis=0)
+            NE[i, i + 1:n] = NErow[i + 1:]
+            NS[i, i + 1:n] = NSrow[i + 1:]
+            if NE.dtype != object and max(NErow.max(), NSrow.max()) >= limit:
+                NE = NE.astype(object)
+                NS = NS.astype(object)
+    if count:
+        return E[:n, :n].tolist(), S[:n, :n].tolist(), NE[:n, :n].tolist(), NS[:n, :n].tolist()
+    return E[:n, :n].tolist(), S[:n, :n].tolist()
+
+
+def FillMatStackingBatch(seqs, BPconsidered="Nussinov"):
+    """Input: - A list seqs of K sequences of nucleotides {A, U, C, G}, all of size n
+              - A model of BP considered BPconsidered
+       Output: The tables E, S, NE and NS of FillMatStacking2 with count set, for all sequences at once as numpy arrays of shape (K, n, n)"""
+    K = len(seqs)
+    n = len(seqs[0]) if K > 0 else 0
+    if any(len(seq) != n for seq in seqs):
+        raise ValueError("All sequences of a batch must have the same size")
+
+    #valid[s, i, k] says if (i, k) is a valid BP over seqs[s].
+    valid = compatibility_array(seqs, BPconsidered)
+    E = np.zeros((K, n + 1, n + 1), dtype=np.int64)
+    S = np.zeros((K, n + 1, n + 1), dtype=np.int64)
+    NE = np.ones((K, n + 1, n + 1), dtype=np.int64)
+    NS = np.ones((K, n + 1, n + 1), dtype=np.int64)
+    #A cell of NE or NS sums at most n + 2 products of two cells. The counts of a sequence going beyond this bound are capped
+    #in the batch and computed again with python integers at the end, so that one degenerate sequence does not slow down the others.
+    limit = math.isqrt(2**63 // (n + 2))
+    overflow = np.zeros(K, dtype=bool)
+    #Larger than any reachable energy, plays the role of math.inf for forbidden splits.
+    big = n + 1
+    cols = np.arange(n)
+
+    for i in range(n - 2, -1, -1):
+        #Only the k valid for at least one sequence of the batch are considered.
+        Ks = np.flatnonzero(valid[:, i, i + 1:].any(axis=0)) + i + 1
+
+        #i base is unpaired
+        case_unpaired = E[:, i + 1, :n]
+
+        #(i,k) forms a valid "pair" that split in a subinstance (i + 1, k - 1) and an exterior instance (k + 1, j), for all sequences, k and j at once.
+        allowed = (cols[None, None, :] > Ks[None, :, None]) & valid[:, i, Ks][:, :, None]
+        splits = np.where(allowed, S[:, i + 1, Ks - 1][:, :, None] + E[:, Ks + 1, :n], big)
+        case_split = np.minimum(case_unpaired, splits.min(axis=1, initial=big))
+
+        #(i, j) placed over (i+1, j-1), only the last BP of a helix does not contribute.
+        case_embraceE = np.where(valid[:, i, :], S[:, i + 1, cols - 1], big)
+        case_embraceS = case_embraceE - 1
+        Erow = np.minimum(case_split, case_embraceE)
+        Srow = np.minimum(case_split, case_embraceS)
+        E[:, i, i + 1:n] = Erow[:, i + 1:]
+        S[:, i, i + 1:n] = Srow[:, i + 1:]
+
+        #Same cases as above, each one reaching the optimal value adds its number of structures.
+        nb_splits = NS[:, i + 1, Ks - 1][:, :, None] * NE[:, Ks + 1, :n]
+        nb_embrace = NS[:, i + 1, cols - 1]
+        NErow = np.where(case_unpaired == Erow, NE[:, i + 1, :n], 0) + np.where(case_embraceE == Erow, nb_embrace, 0) + ((splits == Erow[:, None, :]) * nb_splits).sum(axis=1)
+        NSrow = np.where(case_unpaired == Srow, NE[:, i + 1, :n], 0) + np.where(case_embraceS == Srow, nb_embrace, 0) + ((splits == Srow[:, None, :]) * nb_splits).sum(axis=1)
+        overflow |= (NErow.max(axis=1, initial=0) >= limit) | (NSrow.max(axis=1, initial=0) >= limit)
+        NE[:, i, i + 1:n] = np.minimum(NErow[:, i + 1:], limit)
+        NS[:, i, i + 1:n] = np.minimum(NSrow[:, i + 1:], limit)
+    E, S, NE, NS = E[:, :n, :n], S[:, :n, :n], NE[:, :n, :n], NS[:, :n, :n]
+    if overflow.any():
+        NE = NE.astype(object)
+        NS = NS.astype(object)
+        for s in np.flatnonzero(overflow):
+            _, _, NEs, NSs = FillMatStackingNumpy(seqs[s], BPconsidered=BPconsidered, count=True)
+            NE[s] = np.array(NEs, dtype=object)
+            NS[s] = np.array(NSs, dtype=object)
+    return E, S, NE, NS
+
+
 def DeltaBackTrackE2(sigma, Slist, delta, E, S, seq, model="Unitary", BPconsidered="Nussinov"):
     """Input: - Set of regions being considered sigma
               - Partial secondary structure asssigned to this point Slist
@@ -108,13 +251,14 @@ def DeltaBackTrackE2(sigma, Slist, delta, E, S, seq, model="Unitary", BPconsider
         newsigma = sigma + [(i + 1, j)]
         resu += DeltaBackTrackE2(newsigma, Slist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
     
-    for k in range(i + 1, j):
-        if isValid(seq, i, k, BPconsidered=BPconsidered):
-            delt =  S[i + 1][k -1] + E[k + 1][j] - E[i][j]
-            if delta - delt>= 0:
-                newsigma = sigma + [(k + 1, j), (i + 1, k - 1)]
-                newSlist = [(i, k)] + Slist
-                resu += DeltaBackTrackS2(newsigma, newSlist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
+    for k in compatibility(seq, BPconsidered)[1][i]:
+        if k >= j:
+            break
+        delt =  S[i + 1][k -1] + E[k + 1][j] - E[i][j]
+        if delta - delt>= 0:
+            newsigma = sigma + [(k + 1, j), (i + 1, k - 1)]
+            newSlist = [(i, k)] + Slist
+            resu += DeltaBackTrackS2(newsigma, newSlist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
 
     return resu
 
@@ -146,18 +290,160 @@ def DeltaBackTrackS2(sigma, Slist, delta, E, S, seq, model="Unitary", BPconsider
         newsigma = sigma + [(i + 1, j)]
         resu += DeltaBackTrackE2(newsigma, Slist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
     
-    for k in range(i + 1, j):
-        if isValid(seq, i, k, BPconsidered=BPconsidered):
-            delt =  S[i + 1][k -1] + E[k + 1][j] - S[i][j]
-            if delta - delt>= 0:
-                newsigma = sigma + [(k + 1, j), (i + 1, k - 1)]
-                newSlist = [(i, k)] + Slist
-                resu += DeltaBackTrackS2(newsigma, newSlist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
+    for k in compatibility(seq, BPconsidered)[1][i]:
+        if k >= j:
+            break
+        delt =  S[i + 1][k -1] + E[k + 1][j] - S[i][j]
+        if delta - delt>= 0:
+            newsigma = sigma + [(k + 1, j), (i + 1, k - 1)]
+            newSlist = [(i, k)] + Slist
+            resu += DeltaBackTrackS2(newsigma, newSlist, delta - delt, E, S, seq, model=model, BPconsidered=BPconsidered)
     
     return resu
 
 
-def delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = "png", name_file = "", show=False):
+def DeltaBackTrackLazy(delta, E, S, seq, limit=None, model="Unitary", BPconsidered="Nussinov"):
+    """Input: - delta, max distance from the optimal allowed
+              - The dynamic programming tables computed E and S
+              - A sequence seq of nucleotides {A, U, C, G} of size n
+              - limit, the maximal number of structures to yield, None for all of them
+              - A energy model to work with
+              - A model of BP considered BPconsidered
+       Output: A generator over the secondary structures of DeltaBackTrackE2, in the same order, stopping after limit structures"""
+    #sigma and Slist are persistent linked lists (head, tail): branches share their common part instead of copying it.
+    #Each element of todo is a pending call of DeltaBackTrackE2 (stacked is False) or DeltaBackTrackS2 (stacked is True).
+    todo = [(((0, len(seq) - 1), None), None, delta, False)]
+    valid, partners = compatibility(seq, BPconsidered)
+    found = 0
+    while todo != [] and (limit is None or found < limit):
+        (sigma, Slist, delta, stacked) = todo.pop()
+        if sigma is None:
+            St = []
+            while Slist is not None:
+                (BP, Slist) = Slist
+                St.append(BP)
+            found += 1
+            yield St
+            continue
+        ((i,j), sigma) = sigma
+        if j<= i:
+            todo.append((sigma, Slist, delta, False))
+            continue
+
+        if stacked:
+            opt = S[i][j]
+            bonus = Energy(seq, i, j, model=model, BPconsidered=BPconsidered)
+        else:
+            opt = E[i][j]
+            bonus = 0
+        branches = []
+        delt = S[i + 1][j - 1] + bonus - opt
+        if delta - delt>= 0 and valid[i][j]:
+            branches.append((((i + 1, j - 1), sigma), ((i, j), Slist), delta - delt, True))
+
+        delt = E[i + 1][j] - opt
+        if delta - delt>= 0:
+            branches.append((((i + 1, j), sigma), Slist, delta - delt, False))
+
+        for k in partners[i]:
+            if k >= j:
+                break
+            delt = S[i + 1][k -1] + E[k + 1][j] - opt
+            if delta - delt>= 0:
+                branches.append((((i + 1, k - 1), ((k + 1, j), sigma)), ((i, k), Slist), delta - delt, True))
+        #Reversed so that the first branch is explored first, as in the recursive version.
+        todo += branches[::-1]
+
+
+def iter_delta_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, limit=None, engine="python"):
+    """Input: - A Sequence seq of letters in {A, U, C, G} of size n
+              - A energy model to work with
+              - A model of BP considered BPconsidered
+              - delta, max distance from the optimal allowed
+              - limit, the maximal number of structures to yield, None for all of them
+              - engine, "python" or "numpy", the implementation used to fill the dynamic programming tables
+       Output: A generator over the structures at distance delta from the optimal, e.g. limit=2 is enough to know if the optimal structure is unique"""
+    if engine == "numpy":
+        E, S = FillMatStackingNumpy(seq, BPconsidered=BPconsidered)
+    elif engine == "python":
+        E, S = FillMatStacking2(seq, BPconsidered=BPconsidered)
+    else:
+        raise ValueError("Not a valid engine for filling the tables")
+    return DeltaBackTrackLazy(delta, E, S, seq, limit=limit, model=model, BPconsidered=BPconsidered)
+
+
+def OptimalBackTrackStacking(E, S, seq, model="Unitary", BPconsidered="Nussinov"):
+    """Input: - The dynamic programming tables computed E and S
+              - A sequence seq of nucleotides {A, U, C, G} of size n
+              - A energy model to work with
+              - A model of BP considered BPconsidered
+       Output: An optimal secondary structure over seq, the first one listed by DeltaBackTrackE2 with delta = 0"""
+    Slist = []
+    sigma = [(0, len(seq) - 1)]
+    valid, partners = compatibility(seq, BPconsidered)
+    #stacked is set when the region on top of sigma is encapsulated by a BP, as in DeltaBackTrackS2.
+    stacked = False
+    while sigma != []:
+        (i,j) = sigma.pop()
+        if j<= i:
+            stacked = False
+            continue
+        if stacked:
+            opt = S[i][j]
+            bonus = Energy(seq, i, j, model=model, BPconsidered=BPconsidered)
+        else:
+            opt = E[i][j]
+            bonus = 0
+        if valid[i][j] and S[i + 1][j - 1] + bonus == opt:
+            Slist.append((i, j))
+            sigma.append((i + 1, j - 1))
+            stacked = True
+        elif E[i + 1][j] == opt:
+            sigma.append((i + 1, j))
+            stacked = False
+        else:
+            for k in partners[i]:
+                if k < j and S[i + 1][k - 1] + E[k + 1][j] == opt:
+                    Slist.append((i, k))
+                    sigma += [(k + 1, j), (i + 1, k - 1)]
+                    stacked = True
+                    break
+    return Slist[::-1]
+
+
+def main_stacking_only_one(seq, model="Unitary", BPconsidered="Nussinov", engine="python"):
+    """Input: - A Sequence seq of letters in {A, U, C, G} of size n
+              - A energy model to work with
+              - A model of BP considered BPconsidered
+              - engine, "python" or "numpy", the implementation used to fill the dynamic programming tables
+       Output: One optimal structure in the stacking model and the number of optimal structures"""
+    if engine == "numpy":
+        E, S, NE, NS = FillMatStackingNumpy(seq, BPconsidered=BPconsidered, count=True)
+    elif engine == "python":
+        E, S, NE, NS = FillMatStacking2(seq, BPconsidered=BPconsidered, count=True)
+    else:
+        raise ValueError("Not a valid engine for filling the tables")
+    Slist = OptimalBackTrackStacking(E, S, seq, model=model, BPconsidered=BPconsidered)
+    return Slist, NE[0][len(seq) - 1]
+
+
+def batch_main_stacking_only_one(seqs, model="Unitary", BPconsidered="Nussinov"):
+    """Input: - A list seqs of K sequences of letters in {A, U, C, G}, all of size n
+              - A energy model to work with
+              - A model of BP considered BPconsidered
+       Output: For each sequence, the same (structure, number of optimal structures) as main_stacking_only_one, the tables being filled for all sequences at once"""
+    if len(seqs) == 0:
+        return []
+    E, S, NE, _ = FillMatStackingBatch(seqs, BPconsidered=BPconsidered)
+    n = len(seqs[0])
+    resu = []
+    for s, seq in enumerate(seqs):
+        Slist = OptimalBackTrackStacking(E[s].tolist(), S[s].tolist(), seq, model=model, BPconsidered=BPconsidered)
+        resu.append((Slist, int(NE[s][0][n - 1])))
+    return resu
+
+
+def delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta = 0, debug = 0, output_format = "png", name_file = "", show=False, engine="python", limit=None):
     """Input: - A Sequence seq of letters in {A, U, C, G} of size n
              - A energy model to work with
              - A model of BP considered BPconsidered
@@ -166,12 +452,19 @@ def delta_main_stacking2(seq, model="Unitary", BPconsidered="Nussinov", delta =
              - output_format is the type of file that we want to save, specify None for no save.
              - name_file is the name of the output Varna file if specified.
              - show is set to False if we want to observe the output directly or not (interactively).
+             - engine, "python" or "numpy", the implementation used to fill the dynamic programming tables
+             - limit, the maximal number of structures to return, None for all of them
       Output: Build a MFE structure, print it and draw it  in the Unitary model"""
-    E, S = FillMatStacking2(seq, BPconsidered=BPconsidered)
+    if engine == "numpy":
+        E, S = FillMatStackingNumpy(seq, BPconsidered=BPconsidered)
+    elif engine == "python":
+        E, S = FillMatStacking2(seq, BPconsidered=BPconsidered)
+    else:
+        raise ValueError("Not a valid engine for filling the tables")
     if debug:
         print(E)
         print(S)
-    Slist = DeltaBackTrackE2([(0, len(seq) - 1)], [], delta, E, S, seq, model=model, BPconsidered=BPconsidered)
+    Slist = list(DeltaBackTrackLazy(delta, E, S, seq, limit=limit, model=model, BPconsidered=BPconsidered))
     for St in Slist:
         if debug:
             print(St)
@@ -0,0 +1,499 @@
+# positioningempiricalmaxstacksdesigns
+# Copyright (C) 2026 THEO BOURY
+
+#Checks that the optimized code gives the same results as the reference code, or as brute-force enumerations,
+#and that the experiments resume from their journal as if they had never stopped. Run with: python -m pytest test_equivalence.py
+
+import csv
+import itertools
+import os
+import random
+from collections import Counter
+from math import exp, log
+
+import numpy as np
+import pytest
+
+import FoldingTurner
+import ResultsStore
+import SecondaryStructureGeneration
+import createrandomsequencesandfold
+from FoldingTurner import set_turner_cache, turner_cache_stats
+from foldingStacking import (FillMatStacking2, FillMatStackingNumpy, FillMatStackingBatch, DeltaBackTrackE2, DeltaBackTrackLazy,
+                             iter_delta_stacking2, main_stacking_only_one, batch_main_stacking_only_one)
+from foldingBP import (isValid, FillMatUnitary, FillMatUnitaryNumpy, FillMatUnitaryBatch, main_unitary_only_one,
+                       batch_main_unitary_only_one)
+from foldingCompatibility import compatibility, compatibility_array
+from ResultsStore import write_store, csv_to_store, load_store, load_column, structure_rows
+from SecondaryStructureGeneration import sscount, sscount_filtered, ssrandom_filtered, ssrandom_batch
+from checkSeparability import (filter, isProper, dbn_to_flat_tree, ssparse, flat_levels, flat_span, flat_children, part,
+                               delta, children_assignments, num_design, stochastic_backtrack, separable_leaf_levels,
+                               sample_designs, isSeparable, fullSeparable, ALL_LEAF_LEVELS, LEAF, PAIR)
+from RandomCompatible import choose_random_seq
+from createrandomsequencesandfold import run_iterations, write_results, resume_point
+
+
+@pytest.fixture(autouse=True)
+def count_tables_dir(tmp_path, monkeypatch):
+    #The count tables are saved in a temporary directory, not in the one of the experiments.
+    monkeypatch.setattr(SecondaryStructureGeneration, "COUNT_TABLES_DIR", str(tmp_path / "count_tables"))
+
+
+def enumerate_structures(kind, k, theta, min_helix):
+    """
+    Input:
+        * kind, "all" for any structure, "stacked" for the content of a base pair that may extend its helix
+        * k, the size
+        * theta, min_helix, as in sscount
+    Output:
+        * A generator over the structures of size k, each one once
+    """
+    if k <= 0:
+        yield ''
+        return
+    for s in enumerate_structures("all", k - 1, theta, min_helix):
+        yield '.' + s
+    if kind == "stacked" and k >= theta + 2:
+        for s in enumerate_structures("stacked", k - 2, theta, min_helix):
+            yield '(' + s + ')'
+    last = k if kind == "all" else k - 1
+    for i in range(theta + 2 * min_helix, last + 1):
+        for a in enumerate_structures("stacked", i - 2 * min_helix, theta, min_helix):
+            for b in enumerate_structures("all", k - i, theta, min_helix):
+                yield '(' * min_helix + a + ')' * min_helix + b
+
+
+def chi_square_ok(counter, expected):
+    """
+    Input:
+        * counter, the number of draws of each outcome
+        * expected, the expected number of draws of each outcome
+    Output:
+        * If the chi-square statistic is below its mean plus 6 standard deviations
+    """
+    chi = sum((counter[s] - e) ** 2 / e for s, e in expected.items())
+    df = len(expected) - 1
+    return set(counter) <= set(expected) and chi < df + 6 * (2 * df) ** 0.5
+
+
+@pytest.mark.parametrize("theta,min_helix", [(3, 1), (1, 1), (3, 2), (1, 2)])
+def test_structure_counts_match_enumeration(theta, min_helix):
+    for n in range(0, 15):
+        structures = list(enumerate_structures("all", n, theta, min_helix))
+        assert len(set(structures)) == len(structures)
+        good = sum(filter(dbn_to_flat_tree(ssparse(s))) for s in structures)
+        tables = {}
+        assert sscount(n, {}, {}, theta, min_helix) == len(structures)
+        assert round(sscount_filtered(n, tables, theta, min_helix)) == good
+        assert round(float(SecondaryStructureGeneration.np.exp(tables["all"][n]))) == len(structures)
+
+
+def test_log_counts_match_the_float_counts():
+    tables = {}
+    sscount_filtered(250, tables, 3, 3)
+    count = {}
+    for n in range(0, 251, 10):
+        assert abs(exp(tables["all"][n] - log(sscount(n, count, {}, 3, 3))) - 1) < 1e-9
+
+
+def test_sscount_raises_beyond_float_range():
+    with pytest.raises(OverflowError):
+        sscount(2000, {}, {}, 3, 3)
+
+
+@pytest.mark.parametrize("large_loop", [False, True, None])
+def test_filtered_sampling_is_uniform(large_loop):
+    (theta, min_helix, n) = (1, 1, 10)
+    structures = list(enumerate_structures("all", n, theta, min_helix))
+    if large_loop is None:
+        pool = structures
+    else:
+        pool = [s for s in structures if filter(dbn_to_flat_tree(ssparse(s))) != large_loop]
+    tables = {}
+    random.seed(12)
+    counter = Counter(ssrandom_filtered(n, tables, theta, min_helix, large_loop=large_loop) for _ in range(10 * len(pool)))
+    assert chi_square_ok(counter, {s: 10 for s in pool})
+    random.seed(13)
+    counter = Counter(ssrandom_batch(n, 20 * len(pool), tables, theta, min_helix, large_loop=large_loop))
+    assert chi_square_ok(counter, {s: 20 for s in pool})
+
+
+def enumerate_designs(ss, m, leaf_level):
+    """
+    Input:
+        * ss, a structure
+        * m, leaf_level, a modulo and a set of leaf levels
+    Output:
+        * The list of the proper designs of ss with A at the unpaired positions, whose leaves are at levels of leaf_level
+          and whose AU and UA base pairs are not, modulo m
+    """
+    t = dbn_to_flat_tree(ssparse(ss))
+    pairs = [t.name[w] for w in range(len(t.name)) if t.kind[w] == PAIR]
+    designs = []
+    for colors in itertools.product(["AU", "UA", "GC", "CG"], repeat=len(pairs)):
+        seq = ['A' for _ in ss]
+        for (i, j), c in zip(pairs, colors):
+            (seq[i], seq[j]) = (c[0], c[1])
+        seq = "".join(seq)
+        if not isProper(t, seq):
+            continue
+        level = flat_levels(t, seq)
+        valid = True
+        for w in range(len(t.name)):
+            if t.kind[w] == LEAF and level[w] % m not in leaf_level:
+                valid = False
+            if t.kind[w] == PAIR and seq[t.name[w][0]] + seq[t.name[w][1]] in ["AU", "UA"] and level[w] % m in leaf_level:
+                valid = False
+        if valid:
+            designs.append(seq)
+    return designs
+
+
+def enumeration_backtrack(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=None):
+    """
+    Input:
+        * t, a flat tree
+        * c, current_level_mod, m, leaves_levels_mod, cache, GCweight, as in stochastic_backtrack
+    Output:
+        * A design sampled as stochastic_backtrack did before its DP over the children:
+          the assignment of the children of each node is drawn from the enumeration of children_assignments
+    """
+    num_design(t, c, current_level_mod, m, leaves_levels_mod, cache, GCweight=GCweight)
+    res = ['' for _ in range(flat_span(t)[1])]
+    stack = [(0, c, current_level_mod)]
+    while stack != []:
+        (w, cw, level_mod) = stack.pop()
+        if t.kind[w] == LEAF:
+            res[t.name[w][0]] = cw
+            continue
+        if t.kind[w] == PAIR:
+            res[t.name[w][0]] = cw[0]
+            res[t.name[w][1]] = cw[1]
+        kids = list(flat_children(t, w))
+        next_level_mod = (level_mod + delta(cw)) % m
+        r = random.random()*cache[(t.name[w], cw, level_mod, m, leaves_levels_mod)]
+        chosen = None
+        for assignment in children_assignments([t.kind[ww] == LEAF for ww in kids], cw):
+            prod = 1
+            if GCweight is not None and (cw in ["GC", "CG"]):
+                prod = exp(GCweight)
+            for i, ww in enumerate(kids):
+                prod *= cache[(t.name[ww], assignment[i], next_level_mod, m, leaves_levels_mod)]
+            r -= prod
+            if r < 0:
+                chosen = assignment
+                break
+        if chosen is None:
+            return None
+        for i in reversed(range(len(kids))):
+            stack.append((kids[i], chosen[i], next_level_mod))
+    return "".join(res)
+
+
+STRUCTURES = ["((((...))))", "((...))((...))", "(((...))((...)))", "..((...))..((...)).", "((..((...))((...))..))", "(((...)))..(((...)))"]
+
+
+@pytest.mark.parametrize("ss", STRUCTURES)
+def test_design_counts_and_samples_match_enumeration(ss):
+    t = dbn_to_flat_tree(ssparse(ss))
+    for m in [2, 3]:
+        counts_all = num_design(t, "R", 0, m, ALL_LEAF_LEVELS, {})
+        for mask, leaf_level in enumerate(part(m - 1)):
+            leaf_level = tuple(leaf_level)
+            designs = enumerate_designs(ss, m, leaf_level)
+            cache = {}
+            assert num_design(t, "R", 0, m, leaf_level, cache) == len(designs) == counts_all[mask]
+            if designs == []:
+                assert sample_designs(t, 3, "R", 0, m, leaf_level, cache) == []
+                continue
+            random.seed(m)
+            counter = Counter(stochastic_backtrack(t, "R", 0, m, leaf_level, cache) for _ in range(20 * len(designs)))
+            assert chi_square_ok(counter, {seq: 20 for seq in designs})
+            random.seed(m)
+            counter = Counter(sample_designs(t, 20 * len(designs), "R", 0, m, leaf_level, cache))
+            assert chi_square_ok(counter, {seq: 20 for seq in designs})
+
+
+@pytest.mark.parametrize("GCweight", [None, 0.7])
+def test_backtrack_draws_the_same_designs_as_the_enumeration(GCweight):
+    random.seed(5)
+    tables = {}
+    for n in [30, 60, 90]:
+        for _ in range(10):
+            t = dbn_to_flat_tree(ssparse(ssrandom_filtered(n, tables, 3, 1)))
+            (found, _) = separable_leaf_levels(t, 4, GCweight=GCweight)
+            if found is None:
+                continue
+            (m, leaf_level) = found
+            cache = {}
+            for seed in range(10):
+                random.seed(seed)
+                x = stochastic_backtrack(t, "R", 0, m, leaf_level, cache, GCweight=GCweight)
+                random.seed(seed)
+                assert enumeration_backtrack(t, "R", 0, m, leaf_level, cache, GCweight=GCweight) == x
+
+
+@pytest.mark.parametrize("ss", STRUCTURES + ["(((...))((...))((...))((...)))", "((...)).((...))"])
+def test_single_pass_validator_matches_the_criteria(ss):
+    t = dbn_to_flat_tree(ssparse(ss))
+    found, _ = separable_leaf_levels(t, 4)
+    designs = [] if found is None else enumerate_designs(ss, found[0], found[1])
+    random.seed(0)
+    seqs = designs + ["".join(random.choice("ACGU") for _ in ss) for _ in range(200)]
+    seqs += [choose_random_seq(t, withA=True) for _ in range(200)]
+    for seq in seqs:
+        assert fullSeparable(seq, ss) == (filter(t) and isProper(t, seq) and isSeparable(t, seq))
+    for seq in designs:
+        assert fullSeparable(seq, ss)
+
+
+def random_row(i, size):
+    """
+    Input:
+        * i, the index of the iteration
+        * size, the number of random numbers
+    Output:
+        * A row of random numbers, failing at the iteration CRASH_AT to simulate a preemption
+    """
+    if i == CRASH_AT[0]:
+        raise RuntimeError("preempted")
+    return [i] + [random.random() for _ in range(size)]
+
+
+CRASH_AT = [-1]
+
+
+@pytest.mark.parametrize("seed,workers", [(None, 1), (4, 1), (None, 2)])
+def test_resume_gives_the_same_file(tmp_path, monkeypatch, seed, workers):
+    monkeypatch.chdir(tmp_path)
+    name = "Results.csv"
+    header = ["i", "x", "y"]
+    jobs = [(i, (2,)) for i in range(8)]
+    CRASH_AT[0] = -1
+    random.seed(1)
+    write_results(name, header, random_row, jobs, workers=workers, seed=seed)
+    with open(name, "rb") as csvfile:
+        full = csvfile.read()
+
+    CRASH_AT[0] = 5
+    random.seed(1)
+    with pytest.raises(RuntimeError):
+        write_results(name, header, random_row, jobs, workers=workers, seed=seed)
+    #A row and a journal record cut by the crash.
+    with open(name, "a") as csvfile:
+        csvfile.write("5 0.1")
+    with open(name + ".journal", "a") as journal:
+        journal.write('{"index": 5, "off')
+
+    CRASH_AT[0] = -1
+    random.seed(2)
+    (restart, last_index) = resume_point(name, True)
+    assert (restart, last_index) == (0, 4)
+    write_results(name, header, random_row, [(i, args) for (i, args) in jobs if i > last_index], restart=restart,
+                  workers=workers, seed=seed)
+    with open(name, "rb") as csvfile:
+        assert csvfile.read() == full
+
+
+@pytest.mark.parametrize("seed,workers,other_seed,other_workers", [(4, 1, 5, 1), (None, 2, 5, 2), (None, 1, 5, 1), (None, 1, None, 2)])
+def test_resume_refuses_another_random_stream(tmp_path, monkeypatch, seed, workers, other_seed, other_workers):
+    monkeypatch.chdir(tmp_path)
+    name = "Results.csv"
+    CRASH_AT[0] = 3
+    with pytest.raises(RuntimeError):
+        write_results(name, ["i", "x"], random_row, [(i, (1,)) for i in range(6)], workers=workers, seed=seed)
+    CRASH_AT[0] = -1
+    with open(name, "rb") as csvfile:
+        written = csvfile.read()
+    (restart, last_index) = resume_point(name, True)
+    with pytest.raises(ValueError):
+        write_results(name, ["i", "x"], random_row, [(i, (1,)) for i in range(last_index + 1, 6)], restart=restart,
+                      workers=other_workers, seed=other_seed)
+    with open(name, "rb") as csvfile:
+        assert csvfile.read() == written
+    with pytest.raises(ValueError):
+        list(run_iterations(random_row, [(0, (1,))], workers=2))
+
+
+def test_turner_cache_is_off_by_default_and_counts_its_entries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folded = []
+
+    def fake_fold(seqs):
+        folded.extend(seqs)
+        return [("." * len(seq), 1) for seq in seqs]
+
+    monkeypatch.setitem(FoldingTurner.TURNER_BACKENDS, "fake", {FoldingTurner.TURNER_PARAMS: fake_fold})
+    assert FoldingTurner.TURNER_CACHE["path"] is None
+    FoldingTurner.fold_turner_batch(["GGGAAACCC"], backend="fake")
+    assert os.listdir(tmp_path) == []
+
+    set_turner_cache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    try:
+        folded.clear()
+        seqs = ["GGGAAACCC", "GGGAAAUCC", "GGGAAAUUC", "GGGAAAUUU", "GGGAAACUU"]
+        FoldingTurner.fold_turner_batch(seqs[:2] + seqs[:1], backend="fake")
+        FoldingTurner.fold_turner_batch(seqs[2:], backend="fake")
+        assert folded == seqs
+        stats = turner_cache_stats()
+        assert (stats["entries"], stats["total_hits"], stats["total_misses"]) == (3, 1, 5)
+        folded.clear()
+        assert FoldingTurner.fold_turner_batch(seqs[2:], backend="fake") == [("." * 9, 1)] * 3
+        assert folded == []
+    finally:
+        set_turner_cache(None)
+
+
+def random_sequences(sizes, alphabets=("ACGU", "GC", "AU", "AGU"), per_size=4):
+    """
+    Input:
+        * sizes, a list of sizes
+        * alphabets, the letters of the sequences, the small ones giving many co-optimal structures
+        * per_size, the number of sequences of each size and alphabet
+    Output:
+        * The list of the random sequences, always the same ones
+    """
+    rng = random.Random(7)
+    return ["".join(rng.choice(letters) for _ in range(n)) for n in sizes for letters in alphabets for _ in range(per_size)]
+
+
+@pytest.mark.parametrize("seq", random_sequences([1, 2, 5, 12, 25, 40]))
+def test_numpy_stacking_tables_match_the_python_ones(seq):
+    assert FillMatStackingNumpy(seq) == FillMatStacking2(seq)
+    assert FillMatStackingNumpy(seq, BPconsidered="Watson") == FillMatStacking2(seq, BPconsidered="Watson")
+
+
+@pytest.mark.parametrize("seq", random_sequences([1, 2, 5, 12, 25, 40]) + ["A" * 30, "A" * 50, "GC" * 30])
+def test_numpy_unitary_table_matches_the_python_one(seq):
+    #Past n = 50 the counts of a sequence of A exceed 2**63 // (2n + 4), the numpy engine then counts with python integers.
+    (M, nb) = FillMatUnitary(seq)
+    assert FillMatUnitaryNumpy(seq) == (M, nb)
+    assert main_unitary_only_one(seq, engine="numpy") == main_unitary_only_one(seq)
+
+
+def test_numpy_unitary_counts_switch_to_python_integers():
+    (_, nb) = FillMatUnitaryNumpy("A" * 50)
+    assert nb >= 2**63 // (2 * 50 + 4)
+    assert isinstance(nb, int) and nb == FillMatUnitary("A" * 50)[1]
+
+
+@pytest.mark.parametrize("seq", random_sequences([1, 2, 5, 9, 14]))
+def test_stacking_counts_match_the_enumeration(seq):
+    n = len(seq)
+    (E, S, NE, NS) = FillMatStacking2(seq, count=True)
+    assert FillMatStackingNumpy(seq, count=True) == (E, S, NE, NS)
+    structures = DeltaBackTrackE2([(0, n - 1)], [], 0, E, S, seq)
+    for engine in ["python", "numpy"]:
+        assert main_stacking_only_one(seq, engine=engine) == (structures[0], len(structures))
+
+
+@pytest.mark.parametrize("seq", random_sequences([2, 6, 10, 14], per_size=3))
+def test_lazy_backtrack_lists_the_structures_in_the_same_order(seq):
+    n = len(seq)
+    (E, S) = FillMatStacking2(seq)
+    for delta in [0, 1, 2]:
+        structures = DeltaBackTrackE2([(0, n - 1)], [], delta, E, S, seq)
+        assert list(DeltaBackTrackLazy(delta, E, S, seq)) == structures
+        assert list(DeltaBackTrackLazy(delta, E, S, seq, limit=3)) == structures[:3]
+        for engine in ["python", "numpy"]:
+            assert list(iter_delta_stacking2(seq, delta=delta, limit=2, engine=engine)) == structures[:2]
+
+
+@pytest.mark.parametrize("BPconsidered", ["Nussinov", "Watson"])
+def test_compatibility_matches_isValid(BPconsidered):
+    for seq in random_sequences([1, 7, 20], per_size=2):
+        (valid, partners) = compatibility(seq, BPconsidered)
+        n = len(seq)
+        assert valid == tuple(tuple(isValid(seq, i, j, BPconsidered) for j in range(n)) for i in range(n))
+        assert partners == tuple(tuple(k for k in range(i + 1, n) if isValid(seq, i, k, BPconsidered)) for i in range(n))
+    with pytest.raises(ValueError):
+        compatibility("ACGU", "Wobble")
+
+
+@pytest.mark.parametrize("n", [1, 2, 9, 20])
+def test_batch_folding_matches_the_single_sequence_folding(n):
+    seqs = random_sequences([n], per_size=3)
+    assert (compatibility_array(seqs) == np.array([compatibility(seq)[0] for seq in seqs], dtype=bool)).all()
+    assert batch_main_stacking_only_one(seqs) == [main_stacking_only_one(seq) for seq in seqs]
+    assert batch_main_unitary_only_one(seqs) == [main_unitary_only_one(seq) for seq in seqs]
+    (E, S, NE, NS) = FillMatStackingBatch(seqs)
+    for s, seq in enumerate(seqs):
+        assert (E[s].tolist(), S[s].tolist(), NE[s].tolist(), NS[s].tolist()) == FillMatStacking2(seq, count=True)
+        assert FillMatUnitaryBatch(seqs)[0][s].tolist() == FillMatUnitary(seq)[0]
+
+
+def test_batch_folding_recounts_the_overflowing_sequences():
+    #The counts of these sequences go past the int64 bounds of the batches, the other sequences of the batch stay in int64.
+    seqs = random_sequences([108], alphabets=("ACGU",), per_size=2) + ["GCA" * 36]
+    assert batch_main_stacking_only_one(seqs) == [main_stacking_only_one(seq, engine="numpy") for seq in seqs]
+    assert batch_main_stacking_only_one(seqs)[-1][1] == FillMatStacking2("GCA" * 36, count=True)[2][0][107]
+    seqs = random_sequences([50], alphabets=("ACGU",), per_size=2) + ["A" * 50]
+    assert batch_main_unitary_only_one(seqs) == [main_unitary_only_one(seq) for seq in seqs]
+
+
+@pytest.mark.parametrize("chunk_rows", [4, 10000])
+def test_store_gives_back_the_csv_values(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(ResultsStore, "CHUNK_ROWS", chunk_rows)
+    rng = random.Random(3)
+    header = ["ss", "seq", "TurnerDesign", "nb_it_more_for_finding_BP", "energy", "comment", "other_seq"]
+    structures = ["((...))", "(((....)))..", "..(((...)))..."]
+    rows = []
+    for _ in range(23):
+        ss = rng.choice(structures)
+        rows.append([ss, "".join(rng.choice("ACGU") for _ in ss), rng.choice(["True", "False"]), str(rng.randint(0, 9)),
+                     str(rng.random()), rng.choice(["a", "b c", "none"]), "".join(rng.choice("ACGU") for _ in range(rng.randint(0, 5)))])
+    names = [str(tmp_path / "shard0.csv"), str(tmp_path / "shard1.csv")]
+    for name, part_rows in zip(names, [rows[:10], rows[10:]]):
+        with open(name, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile, delimiter=' ', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(header)
+            writer.writerows(part_rows)
+    csv_to_store(names, str(tmp_path / "store.npz"))
+    store = load_store(str(tmp_path / "store.npz"))
+    assert list(store["kinds"]) == ["structure", "sequence", "bool", "int", "float", "text", "sequence"]
+    for k, column in enumerate(header):
+        values = load_column(store, column)
+        if column == "TurnerDesign":
+            values = [str(val) for val in values.tolist()]
+        elif column in ["nb_it_more_for_finding_BP", "energy"]:
+            values = [repr(val) for val in values.tolist()]
+        assert values == [row[k] for row in rows]
+    assert {ss: list(ids) for ss, ids in structure_rows(store).items()} == \
+        {ss: [r for r in range(len(rows)) if rows[r][0] == ss] for ss in structures}
+    with pytest.raises(ValueError):
+        write_store(str(tmp_path / "bad.npz"), ["seq"], [["ACGT"]])
+
+
+def test_separable_rows_record_the_modulo_and_the_leaf_levels(monkeypatch):
+    #The Turner folding is not needed to check the design.
+    monkeypatch.setattr(createrandomsequencesandfold, "fold_turner", lambda seq, target=None: ("." * len(seq), 1))
+    random.seed(3)
+    for i in range(5):
+        row = createrandomsequencesandfold.iteration_from_Separable_A_only_nom3o_nom5(i, 40, 3, 3)
+        (ss, seq, m, mask) = (row[0], row[1], row[6], row[7])
+        t = dbn_to_flat_tree(ssparse(ss))
+        level = flat_levels(t, seq)
+        for w in range(len(t.name)):
+            if t.kind[w] == LEAF:
+                assert (mask >> (level[w] % m)) & 1
+            elif t.kind[w] == PAIR and seq[t.name[w][0]] + seq[t.name[w][1]] in ["AU", "UA"]:
+                assert not (mask >> (level[w] % m)) & 1
+
+
+@pytest.mark.parametrize("lazy_turner", [False, True])
+def test_lazy_turner_gives_the_target_and_its_own_files(monkeypatch, lazy_turner):
+    targets = []
+    def fold(seq, target=None):
+        targets.append(target)
+        return ("." * len(seq), 1)
+    monkeypatch.setattr(createrandomsequencesandfold, "fold_turner", fold)
+    random.seed(3)
+    row = createrandomsequencesandfold.iteration_from_Stacking_A_only_nom3o_nom5(0, 40, 3, 3, lazy_turner)
+    #The random compatible sequence of the refinement is folded with the target of the refined row.
+    createrandomsequencesandfold.iteration_refine_from_Stacking_A_only_withm3o_withm5(1, row[0], row[1], "False", row[0], lazy_turner)
+    expected = [row[0]] * 2
+    if not lazy_turner:
+        expected = [None] * 2
+    assert targets == expected
+    name = createrandomsequencesandfold.results_name("ResultsfromStacking.csv", lazy_turner)
+    assert name == ("ResultsfromStacking_lazyturner.csv" if lazy_turner else "ResultsfromStacking.csv")